@@ -0,0 +1,178 @@
+import os
+
+SKIP = "skip"
+REMUX = "remux"
+ENCODE = "encode"
+
+ACTION_LABELS = {SKIP: "Skip", REMUX: "Remux", ENCODE: "Encode"}
+
+# Rough video bits per pixel per frame that libx264 settles at for typical
+# footage at each CRF. A source already at or below this would not shrink
+# meaningfully by being re-encoded at that CRF.
+CRF_BITS_PER_PIXEL = {
+    18: 0.20,
+    23: 0.10,
+    28: 0.05,
+    32: 0.03,
+}
+
+# Shared by every front end, so the windows and the CLI offer the same choices.
+QUALITY_CRF = {
+    "High Quality (Large)": 18,
+    "Medium Quality": 23,
+    "Low Quality (Small)": 28,
+    "Very Low (Tiny file)": 32,
+}
+SCALE_MAP = {"1080p": (1920, 1080), "720p": (1280, 720), "480p": (854, 480)}
+
+
+RATE_QUALITY = "Quality (CRF)"
+RATE_TARGET_SIZE = "Target Size (MB)"
+RATE_TARGET_BIT_RATE = "Target Bitrate (kb/s)"
+RATE_MODES = [RATE_QUALITY, RATE_TARGET_SIZE, RATE_TARGET_BIT_RATE]
+
+# libswscale interpolation for downscaling, by UI label. Fast bilinear is
+# noticeably softer but cheap enough for draft outputs.
+SCALERS = {
+    "Bicubic": "bicubic",
+    "Lanczos (Sharp)": "lanczos",
+    "Area (Smooth)": "area",
+    "Bilinear": "bilinear",
+    "Fast Bilinear (Draft)": "fast_bilinear",
+}
+DEFAULT_SCALER = "bicubic"
+
+# Share of a target size to leave for container overhead.
+CONTAINER_OVERHEAD = 0.02
+# Below this libx264 output is unwatchable, so targets don't go lower.
+MIN_VIDEO_BIT_RATE = 100000
+DEFAULT_AUDIO_BIT_RATE = 128000
+
+
+def target_bit_rate(metadata, target_size=None, target_bit_rate=None):
+    """Total bits per second to aim for, from a size in bytes or a bitrate."""
+    if target_bit_rate:
+        return target_bit_rate
+    duration = (metadata or {}).get('duration')
+    if target_size and duration:
+        return target_size * 8 / duration
+    return None
+
+
+def rate_mode_bit_rate(metadata, mode, value):
+    """Total target bitrate for one of RATE_MODES, or None in quality mode."""
+    if mode == RATE_TARGET_SIZE:
+        return target_bit_rate(metadata, target_size=value * 1024 * 1024)
+    if mode == RATE_TARGET_BIT_RATE:
+        return target_bit_rate(metadata, target_bit_rate=value * 1000)
+    return None
+
+
+LOSSLESS_AUDIO_CODECS = ("alac", "flac", "truehd", "wavpack", "mlp")
+
+
+def estimate_audio_bit_rate(audio):
+    if audio.get('bit_rate'):
+        return audio['bit_rate']
+    # Containers like MKV often don't store a bitrate; lossless audio is
+    # far above a lossy default, so estimate it from the sample format.
+    codec = audio.get('codec') or ""
+    pcm_bit_rate = (audio.get('sample_rate') or 48000) * (audio.get('channels') or 2) * 16
+    if codec.startswith("pcm_"):
+        return pcm_bit_rate
+    if codec in LOSSLESS_AUDIO_CODECS:
+        return pcm_bit_rate * 6 // 10
+    return DEFAULT_AUDIO_BIT_RATE
+
+
+def source_audio_bit_rate(metadata):
+    return sum(estimate_audio_bit_rate(a) for a in (metadata or {}).get('audio_streams', []))
+
+
+def video_bit_rate_for_target(total_bit_rate, audio_bit_rate):
+    return max(MIN_VIDEO_BIT_RATE, int(total_bit_rate * (1 - CONTAINER_OVERHEAD) - audio_bit_rate))
+
+
+def bits_per_pixel(metadata):
+    width, height, fps = metadata.get('width'), metadata.get('height'), metadata.get('fps')
+    if not (width and height and fps):
+        return None
+    video_bit_rate = metadata.get('video_bit_rate')
+    if not video_bit_rate and metadata.get('bit_rate'):
+        audio_bit_rate = sum(a.get('bit_rate') or 0 for a in metadata.get('audio_streams', []))
+        video_bit_rate = metadata['bit_rate'] - audio_bit_rate
+    if not video_bit_rate or video_bit_rate <= 0:
+        return None
+    return video_bit_rate / (width * height * fps)
+
+
+def fit_resolution(width, height, box):
+    """The largest even size with the source aspect ratio that fits in ``box``.
+
+    Sources that already fit are left at their size rather than upscaled;
+    with no ``box`` the source size is returned.
+    """
+    if not box or not width or not height or (width <= box[0] and height <= box[1]):
+        return width, height
+    scale = min(box[0] / width, box[1] / height)
+    return max(2, int(width * scale / 2 + 0.5) * 2), max(2, int(height * scale / 2 + 0.5) * 2)
+
+
+def analyze_file(metadata, input_file, output_ext, crf, resolution=None, max_bit_rate=None):
+    """Decide whether a file needs re-encoding, only a remux, or nothing.
+
+    ``output_ext`` is the target container extension (without the dot) and
+    ``resolution`` the target ``(width, height)`` box, or None to keep the
+    source size. With ``max_bit_rate`` (a target size or bitrate) a file
+    already under it is left alone instead of being judged by ``crf``.
+    Returns ``(action, reason)``.
+    """
+    if not metadata:
+        return ENCODE, "no metadata"
+    if metadata.get('video_codec') != "h264":
+        return ENCODE, f"source codec is {metadata.get('video_codec') or 'unknown'}"
+    if metadata.get('pix_fmt') not in (None, "yuv420p"):
+        return ENCODE, f"pixel format is {metadata['pix_fmt']}"
+    width, height = metadata.get('width') or 0, metadata.get('height') or 0
+    if resolution and (width > resolution[0] or height > resolution[1]):
+        return ENCODE, f"{width}x{height} is above {resolution[0]}x{resolution[1]}"
+    source_ext = os.path.splitext(input_file)[1].lstrip(".").lower()
+    if max_bit_rate:
+        bit_rate = metadata.get('bit_rate')
+        if not bit_rate:
+            return ENCODE, "unknown bitrate"
+        if bit_rate > max_bit_rate:
+            return ENCODE, f"{bit_rate / 1000:.0f} kb/s is above the {max_bit_rate / 1000:.0f} kb/s target"
+        if source_ext == output_ext.lower():
+            return SKIP, f"already H.264 under the target at {bit_rate / 1000:.0f} kb/s"
+        return REMUX, f"already H.264 under the target at {bit_rate / 1000:.0f} kb/s, changing container"
+    bpp = bits_per_pixel(metadata)
+    if bpp is None:
+        return ENCODE, "unknown bitrate"
+    target_bpp = CRF_BITS_PER_PIXEL.get(crf)
+    if target_bpp is None or bpp > target_bpp:
+        return ENCODE, f"{bpp:.3f} bits/pixel is above target"
+    if source_ext == output_ext.lower():
+        return SKIP, f"already H.264 at {bpp:.3f} bits/pixel"
+    return REMUX, f"already H.264 at {bpp:.3f} bits/pixel, changing container"
+
+
+ESTIMATE_SAMPLES = 3
+ESTIMATE_SAMPLE_SECONDS = 2
+
+
+def sample_windows(duration, samples=ESTIMATE_SAMPLES, sample_seconds=ESTIMATE_SAMPLE_SECONDS):
+    """``(start, length)`` slices in seconds spread evenly over a file."""
+    if duration <= samples * sample_seconds:
+        return [(0.0, duration)]
+    return [(duration * (i + 0.5) / samples - sample_seconds / 2, sample_seconds) for i in range(samples)]
+
+
+def project_estimate(duration, sampled_seconds, video_bytes, encode_seconds, ssim, audio_bit_rate):
+    """Scale what the sample slices took up to the whole file."""
+    scale = duration / sampled_seconds if sampled_seconds else 0
+    return {
+        'size': int(video_bytes * scale + audio_bit_rate * duration / 8),
+        'seconds': encode_seconds * scale,
+        'ssim': ssim,
+    }
@@ -0,0 +1,384 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import av
+
+import analysis
+import cli
+import engine
+import ffmpeg_tools
+
+CLI_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+DEFAULT_CLIPS = ["640x360x10", "1280x720x10"]
+DEFAULT_PRESETS = ["ultrafast", "fast"]
+DEFAULT_RESOLUTIONS = ["original", "480p"]
+DEFAULT_FORMATS = ["mp4"]
+CLIP_RATE = 30
+STRESS_CLIP = (160, 120, 1)
+STRESS_STEPS = 4
+
+
+def parse_clip(spec):
+    """``WIDTHxHEIGHTxSECONDS``, e.g. ``1280x720x10``."""
+    try:
+        width, height, seconds = (int(part) for part in spec.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHTxSECONDS, got {spec!r}")
+    return width, height, seconds
+
+
+def make_clip(path, width, height, seconds, rate=CLIP_RATE):
+    """Write a synthetic H.264/AAC clip from libavfilter's testsrc2 and sine sources.
+
+    A little temporal noise keeps the encoder from compressing the test
+    pattern down to nothing, so the numbers look more like camera footage.
+    """
+    video_source = f"testsrc2=size={width}x{height}:rate={rate}:duration={seconds},noise=alls=12:allf=t"
+    audio_source = f"sine=frequency=440:sample_rate=48000:duration={seconds}"
+    partial = path + ".partial.mp4"
+    with av.open(video_source, format="lavfi") as video_in, av.open(audio_source, format="lavfi") as audio_in, \
+            av.open(partial, "w") as out:
+        video_out = out.add_stream("libx264", rate=rate)
+        video_out.width, video_out.height, video_out.pix_fmt = width, height, "yuv420p"
+        video_out.options = {'crf': "16", 'preset': "veryfast"}
+        audio_out = out.add_stream("aac", rate=48000)
+        for frame in video_in.decode(video=0):
+            out.mux(video_out.encode(frame))
+        out.mux(video_out.encode(None))
+        for frame in audio_in.decode(audio=0):
+            frame.pts = None
+            out.mux(audio_out.encode(frame))
+        out.mux(audio_out.encode(None))
+    os.replace(partial, path)
+
+
+def ensure_clips(clips, clip_dir, on_log):
+    os.makedirs(clip_dir, exist_ok=True)
+    paths = {}
+    for width, height, seconds in clips:
+        path = os.path.join(clip_dir, f"{width}x{height}_{seconds}s.mp4")
+        if not os.path.exists(path):
+            on_log(f"Generating {os.path.basename(path)}")
+            make_clip(path, width, height, seconds)
+        paths[(width, height, seconds)] = path
+    return paths
+
+
+def run_measured(cmd, env):
+    """Run ``cmd`` and return (exit code, output, wall seconds, CPU seconds, peak RSS in bytes).
+
+    CPU time and peak RSS include the process's own children (the ffmpeg
+    engine's encoders, the PyAV engine's segment workers). They need
+    ``os.wait4`` and are ``None`` where it does not exist (Windows).
+    """
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+    output = proc.stdout.read()
+    proc.stdout.close()
+    if not hasattr(os, "wait4"):
+        code = proc.wait()
+        return code, output, time.perf_counter() - started, None, None
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return proc.returncode, output, wall, usage.ru_utime + usage.ru_stime, peak_rss
+
+
+def run_config(clip_path, frames, config, work_dir, env, repeat):
+    samples = []
+    for _ in range(repeat):
+        out_dir = tempfile.mkdtemp(prefix="run_", dir=work_dir)
+        try:
+            cmd = [
+                sys.executable, CLI_SCRIPT, clip_path, "-o", out_dir, "--engine", config['engine'],
+                "--preset", config['preset'], "-r", config['resolution'], "--scaler", config['scaler'],
+                "-f", config['format'],
+                "-j", "1", "--no-resume",
+            ]
+            code, output, wall, cpu, peak_rss = run_measured(cmd, env)
+            outputs = [os.path.join(out_dir, name) for name in os.listdir(out_dir) if not name.startswith(".")]
+            if code != 0 or not outputs:
+                return dict(config, ok=False, error=output.strip().splitlines()[-1] if output.strip() else f"exit {code}")
+            samples.append((wall, cpu, peak_rss, os.path.getsize(outputs[0])))
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+    wall = statistics.median(sample[0] for sample in samples)
+    cpu = statistics.median(sample[1] for sample in samples) if samples[0][1] is not None else None
+    peak_rss = max(sample[2] for sample in samples) if samples[0][2] is not None else None
+    return dict(
+        config,
+        ok=True,
+        wall_seconds=round(wall, 3),
+        cpu_seconds=round(cpu, 3) if cpu is not None else None,
+        fps=round(frames / wall, 1) if wall else None,
+        peak_rss_mb=round(peak_rss / (1024 * 1024), 1) if peak_rss is not None else None,
+        output_bytes=samples[0][3],
+    )
+
+
+def open_fd_count():
+    """File descriptors this process holds, or None where /proc is not available."""
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def current_rss():
+    """Resident set size in bytes, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def cli_preparation(clip_path, work_dir):
+    """Prepare jobs the way ``cli.py`` does; returns ``prepare(files)`` and a no-op cleanup."""
+    args = cli.build_parser().parse_args([clip_path, "-o", work_dir, "--smart"])
+
+    def prepare(files):
+        planned = cli.plan_jobs(files, args, engine.get_video_metadata)
+        return len([engine.build_job(row, input_file, output_file, metadata, action=action)
+                    for row, input_file, output_file, metadata, action in planned])
+
+    return prepare, lambda: None
+
+
+def gui_preparation(work_dir):
+    """Prepare jobs the way the PyAV window does, on Qt's offscreen platform.
+
+    Files go through ``FileTableModel.add_files`` and ``fetchMore``, get
+    probed by the window's ``ProbeWorker`` and become jobs in
+    ``prepare_jobs``, which is all of ``compress_all`` short of encoding.
+    Returns ``prepare(files)`` and a cleanup that closes the window.
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import QModelIndex, QSettings
+    from PyQt5.QtWidgets import QApplication
+
+    import pyav
+
+    # Read settings from an empty folder rather than the user's, where Qt keeps them in files.
+    settings_dir = tempfile.mkdtemp(prefix="settings_", dir=work_dir)
+    for settings_format in (QSettings.NativeFormat, QSettings.IniFormat):
+        QSettings.setPath(settings_format, QSettings.UserScope, settings_dir)
+    app = QApplication.instance() or QApplication([])
+    window = pyav.PyAVCompressor()
+    window.output_path.setText(work_dir)
+
+    def prepare(files):
+        window.clear_table()
+        window.log.clear()
+        rows = window.files.add_files(files)
+        while window.files.canFetchMore(QModelIndex()):
+            window.files.fetchMore(QModelIndex())
+        window.start_probe(rows)
+        while window.probe_workers:
+            for worker in list(window.probe_workers):
+                worker.wait()
+            # Delivers the queued probe results, then the workers' finished signals.
+            app.processEvents()
+        jobs, _ = window.prepare_jobs()
+        return len(jobs)
+
+    def cleanup():
+        window.close()
+        shutil.rmtree(settings_dir, ignore_errors=True)
+
+    return prepare, cleanup
+
+
+def stress_job_preparation(prepare, clip_path, batch_size, work_dir, rss_limit_mb, on_log):
+    """Prepare ever larger batches with ``prepare(files)`` and check resources stay flat.
+
+    Every file is a fresh hard link of ``clip_path``, so each one misses the
+    metadata cache and really gets opened. Every later batch must end with
+    as many open file descriptors as the first (which also opens the
+    metadata cache), and RSS may not grow by more than ``rss_limit_mb``
+    from the first batch to the last.
+    """
+    input_dir = tempfile.mkdtemp(prefix="stress_", dir=work_dir)
+    steps = []
+    try:
+        for step in range(1, STRESS_STEPS + 1):
+            files = []
+            for index in range(batch_size * step // STRESS_STEPS):
+                path = os.path.join(input_dir, f"{step}_{index}.mp4")
+                try:
+                    os.link(clip_path, path)
+                except OSError:
+                    shutil.copyfile(clip_path, path)
+                files.append(path)
+            started = time.perf_counter()
+            jobs = prepare(files)
+            steps.append(dict(files=len(files), jobs=jobs, seconds=round(time.perf_counter() - started, 3),
+                              open_fds=open_fd_count(), rss_mb=round((current_rss() or 0) / (1024 * 1024), 1)))
+            on_log(f"Prepared {jobs} of {len(files)} file(s): {steps[-1]['open_fds']} open fds, "
+                   f"{steps[-1]['rss_mb']} MB RSS")
+    finally:
+        shutil.rmtree(input_dir, ignore_errors=True)
+
+    problems = []
+    fds_first = steps[0]['open_fds']
+    if fds_first is not None and any(step['open_fds'] > fds_first for step in steps):
+        problems.append(f"open fds grew from {fds_first} to {max(step['open_fds'] for step in steps)}")
+    rss_growth = steps[-1]['rss_mb'] - steps[0]['rss_mb']
+    if current_rss() is not None and rss_growth > rss_limit_mb:
+        problems.append(f"RSS grew by {rss_growth:.1f} MB")
+    return dict(batch_size=batch_size, steps=steps, ok=not problems, problems=problems)
+
+
+def config_key(result):
+    return (result['engine'], result['clip'], result['preset'], result['resolution'],
+            result.get('scaler', analysis.DEFAULT_SCALER), result['format'])
+
+
+def compare(results, baseline, tolerance, on_log):
+    """Log configurations that got slower than ``baseline`` and return how many did."""
+    previous = {config_key(result): result for result in baseline.get('results', []) if result.get('ok')}
+    regressions = 0
+    for result in results:
+        before = previous.get(config_key(result))
+        if not result.get('ok') or not before or not before.get('fps') or not result.get('fps'):
+            continue
+        change = result['fps'] / before['fps'] - 1
+        if change < -tolerance:
+            regressions += 1
+            on_log(f"[WARNING] Slower: {' '.join(config_key(result))}: "
+                   f"{before['fps']} -> {result['fps']} fps ({change:+.0%})")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the compression engines on synthetic clips.")
+    parser.add_argument("--clips", type=parse_clip, nargs="+", default=[parse_clip(spec) for spec in DEFAULT_CLIPS],
+                        metavar="WxHxS", help=f"synthetic clips to encode (default: {' '.join(DEFAULT_CLIPS)})")
+    parser.add_argument("--engines", nargs="+", choices=["pyav", "ffmpeg"], default=["pyav", "ffmpeg"])
+    parser.add_argument("--presets", nargs="+", choices=engine.X264_PRESETS, default=DEFAULT_PRESETS)
+    parser.add_argument("--resolutions", nargs="+", choices=["original"] + list(analysis.SCALE_MAP),
+                        default=DEFAULT_RESOLUTIONS)
+    parser.add_argument("--scalers", nargs="+", choices=list(analysis.SCALERS.values()),
+                        default=[analysis.DEFAULT_SCALER])
+    parser.add_argument("--formats", nargs="+", choices=engine.FORMATS, default=DEFAULT_FORMATS)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per configuration, the median is reported")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "video_compressor_bench"),
+                        help="where clips are generated and kept between runs")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare fps against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="fps drop against --baseline that counts as a regression (default: 0.10)")
+    parser.add_argument("--stress", type=int, metavar="FILES",
+                        help="instead of encoding, prepare growing batches of up to FILES inputs and check that "
+                             "open file descriptors and RSS stay flat")
+    parser.add_argument("--stress-rss-mb", type=float, default=32,
+                        help="RSS growth from the smallest to the largest --stress batch that counts as a leak "
+                             "(default: 32)")
+    return parser
+
+
+def base_report():
+    return {
+        'version': engine.__version__,
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'av': av.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_report(report, output):
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def run_stress(args, on_log):
+    os.makedirs(args.work_dir, exist_ok=True)
+    clip_path = ensure_clips([STRESS_CLIP], os.path.join(args.work_dir, "clips"), on_log)[STRESS_CLIP]
+    # Probe into a throwaway metadata cache, the user's would hide every open.
+    os.environ['XDG_CACHE_HOME'] = os.environ['LOCALAPPDATA'] = tempfile.mkdtemp(prefix="cache_", dir=args.work_dir)
+    report = base_report()
+    try:
+        for key, setup in (('stress', lambda: cli_preparation(clip_path, args.work_dir)),
+                           ('stress_gui', lambda: gui_preparation(args.work_dir))):
+            try:
+                prepare, cleanup = setup()
+            except ImportError as e:
+                on_log(f"[WARNING] Skipping the GUI stress run: {e}")
+                continue
+            on_log(f"{key}:")
+            try:
+                report[key] = stress_job_preparation(prepare, clip_path, args.stress, args.work_dir,
+                                                     args.stress_rss_mb, on_log)
+            finally:
+                cleanup()
+            for problem in report[key]['problems']:
+                on_log(f"[ERROR] {key}: {problem}")
+    finally:
+        shutil.rmtree(os.environ['XDG_CACHE_HOME'], ignore_errors=True)
+    write_report(report, args.output)
+    return 0 if all(report[key]['ok'] for key in ('stress', 'stress_gui') if key in report) else 1
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    def on_log(line):
+        print(line, file=sys.stderr, flush=True)
+
+    if args.stress:
+        return run_stress(args, on_log)
+
+    engines = list(args.engines)
+    if "ffmpeg" in engines and not os.path.exists(ffmpeg_tools.get_binary_path("ffmpeg.exe")):
+        on_log("[WARNING] ffmpeg not found, skipping the ffmpeg engine")
+        engines.remove("ffmpeg")
+
+    clips = ensure_clips(args.clips, os.path.join(args.work_dir, "clips"), on_log)
+    # Keep the metadata cache and job journal of benchmark runs away from the user's.
+    env = dict(os.environ, XDG_CACHE_HOME=os.path.join(args.work_dir, "cache"),
+               LOCALAPPDATA=os.path.join(args.work_dir, "cache"))
+    results = []
+    for (width, height, seconds), clip_path in clips.items():
+        for engine_name in engines:
+            for preset in args.presets:
+                for resolution in args.resolutions:
+                    for scaler in args.scalers if resolution != "original" else [analysis.DEFAULT_SCALER]:
+                        for format_ext in args.formats:
+                            config = dict(engine=engine_name, clip=f"{width}x{height}x{seconds}", preset=preset,
+                                          resolution=resolution, scaler=scaler, format=format_ext)
+                            on_log(f"Running {' '.join(config_key(config))}")
+                            result = run_config(clip_path, seconds * CLIP_RATE, config, args.work_dir, env,
+                                                args.repeat)
+                            if not result['ok']:
+                                on_log(f"[ERROR] {result['error']}")
+                            results.append(result)
+
+    report = dict(base_report(), results=results)
+    write_report(report, args.output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance, on_log)
+        if regressions:
+            return 1
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
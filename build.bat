@@ -44,8 +44,9 @@ rmdir /s /q dist
 if exist %NAME%.spec del %NAME%.spec
 
 echo.
-echo 🛠 Injecting version into ffmpeg.py...
+echo 🛠 Injecting version into ffmpeg.py and engine.py...
 powershell -Command "(Get-Content ffmpeg.py) -replace '__version__ = \".*?\"', '__version__ = \"%VERSION%\"' | Set-Content ffmpeg.py"
+powershell -Command "(Get-Content engine.py) -replace '__version__ = \".*?\"', '__version__ = \"%VERSION%\"' | Set-Content engine.py"
 
 echo.
 echo ✅ Activating virtual environment...
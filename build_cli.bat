@@ -0,0 +1,24 @@
+@echo off
+set /p VERSION=<version.txt
+set VERSION=%VERSION: =%
+set NAME=video_compressor_cli_v%VERSION%
+
+REM Clean previous build
+if exist dist rmdir /s /q dist
+if exist build rmdir /s /q build
+if exist %NAME%.spec del %NAME%.spec
+
+echo ✅ Activating virtual environment...
+call venv\\Scripts\\activate
+
+REM Build console executable (no Qt)
+pyinstaller ^
+--name "%NAME%" ^
+--onefile ^
+--console ^
+--exclude-module PyQt5 ^
+--add-data "ffmpeg.exe;." ^
+--add-data "ffprobe.exe;." ^
+cli.py
+
+pause
@@ -0,0 +1,283 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+import analysis
+import engine
+import ffmpeg_tools
+from job_io import IOScheduler, output_key
+from job_journal import JobJournal
+from job_stats import default_report_dir, format_stage_breakdown
+from metadata_cache import get_metadata_cache
+from watch_folder import (
+    DEFAULT_POLL_SECONDS, DEFAULT_SETTLE_SECONDS, VIDEO_EXTENSIONS, FolderWatcher, WatchIndex, same_folder,
+)
+
+QUALITY_CHOICES = {
+    "high": "High Quality (Large)",
+    "medium": "Medium Quality",
+    "low": "Low Quality (Small)",
+    "tiny": "Very Low (Tiny file)",
+}
+
+
+def expand_inputs(patterns):
+    # Windows shells don't expand globs, so always do it here.
+    files = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for match in sorted(matches):
+            if os.path.isdir(match):
+                for root, _, names in os.walk(match):
+                    files.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(VIDEO_EXTENSIONS))
+            else:
+                files.append(match)
+    unique, seen = [], set()
+    for file in files:
+        path = os.path.abspath(file)
+        if path not in seen:
+            seen.add(path)
+            unique.append(file)
+    return unique
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Batch video compressor (no GUI).")
+    parser.add_argument("inputs", nargs="*", help="input files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", help="folder to write compressed files to")
+    parser.add_argument("--engine", choices=["pyav", "ffmpeg"], default="pyav")
+    parser.add_argument("-q", "--quality", choices=list(QUALITY_CHOICES), default="medium")
+    parser.add_argument("--preset", choices=engine.X264_PRESETS, default="fast")
+    parser.add_argument("-r", "--resolution", choices=["original"] + list(analysis.SCALE_MAP), default="original")
+    parser.add_argument("--scaler", choices=list(analysis.SCALERS.values()), default=analysis.DEFAULT_SCALER,
+                        help="interpolation used when downscaling (default: %(default)s)")
+    parser.add_argument("-f", "--format", choices=engine.FORMATS,
+                        help="output container (default: mp4 for pyav, the source container for ffmpeg)")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--target-size", type=float, metavar="MB",
+                        help="two-pass encode each file to about this size instead of using --quality")
+    target.add_argument("--target-bitrate", type=float, metavar="KBPS",
+                        help="two-pass encode each file at about this total bitrate instead of using --quality")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="files to compress at once (default: auto)")
+    parser.add_argument("--threads", type=int, default=0, help="encoder threads per job, pyav only (default: auto)")
+    parser.add_argument("--smart", action="store_true", help="skip or remux files that re-encoding would not shrink")
+    parser.add_argument("--chunk", action="store_true", help="split long videos across cores, pyav only")
+    parser.add_argument("--copy-subs", action="store_true", help="copy subtitle and data streams, pyav only")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="re-encode files an earlier, interrupted run already finished")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and compress new files as they appear in the input folders")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS,
+                        help=f"seconds between watch folder checks (default: {DEFAULT_POLL_SECONDS})")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help=f"seconds a new file must stop growing before it is compressed (default: {DEFAULT_SETTLE_SECONDS})")
+    parser.add_argument("--stats", action="store_true",
+                        help="print a per-stage timing breakdown for each file and save it as JSON, pyav only")
+    parser.add_argument("--profile", action="store_true",
+                        help="also run each file under cProfile and save the .prof file, pyav only")
+    parser.add_argument("--report-dir", help=f"where --stats/--profile write reports (default: {default_report_dir()})")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="copy the next file to local scratch space while the current one encodes, pyav only")
+    parser.add_argument("--scratch-dir", help="where --prefetch copies files to (default: the system temp folder)")
+    parser.add_argument("--readers-per-volume", type=int, default=0, metavar="N",
+                        help="files read at once from any one drive other than the scratch drive, pyav only "
+                             "(default: no limit)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show ffmpeg output")
+    parser.add_argument("--version", action="store_true", help="print the version and exit")
+    return parser
+
+
+def target_bit_rate(metadata, args):
+    return analysis.target_bit_rate(
+        metadata,
+        target_size=args.target_size * 1024 * 1024 if args.target_size else None,
+        target_bit_rate=args.target_bitrate * 1000 if args.target_bitrate else None,
+    )
+
+
+def plan_jobs(files, args, probe, skipped=None):
+    """Jobs worth running for ``files``; smart-skipped inputs are appended to ``skipped``."""
+    cache = get_metadata_cache()
+    crf = analysis.QUALITY_CRF[QUALITY_CHOICES[args.quality]]
+    resolution = analysis.SCALE_MAP.get(args.resolution)
+    planned = []
+    writers = {}  # output key -> input writing it
+    for row, input_file in enumerate(files):
+        format_ext = args.format or (os.path.splitext(input_file)[1].lstrip(".") if args.engine == "ffmpeg" else "mp4")
+        output_file = engine.make_output_path(input_file, args.output_dir, format_ext)
+        if os.path.abspath(input_file) == os.path.abspath(output_file):
+            print(f"[ERROR] Input and output paths are the same, skipping {input_file}")
+            continue
+        if output_key(output_file) in writers:
+            # Every output goes straight into --output-dir, named after the input's file name.
+            print(f"[ERROR] {input_file} and {writers[output_key(output_file)]} would both be written to "
+                  f"{output_file}, skipping {input_file}")
+            continue
+        try:
+            metadata = cache.get_or_probe(input_file, probe)
+        except Exception as e:
+            print(f"[ERROR] Could not read file: {input_file} - {e}")
+            continue
+        action = analysis.ENCODE
+        if args.smart:
+            action, reason = analysis.analyze_file(
+                metadata, input_file, format_ext, crf, resolution, target_bit_rate(metadata, args)
+            )
+            if action == analysis.SKIP:
+                print(f"Skipped: {input_file} ({reason})")
+                if skipped is not None:
+                    skipped.append(input_file)
+                continue
+        writers[output_key(output_file)] = input_file
+        planned.append((row, input_file, output_file, metadata, action))
+    return planned
+
+
+def resume_jobs(jobs, journal, args, probe):
+    if not args.no_resume:
+        jobs = journal.filter_pending(jobs, probe)
+    journal.start_batch(jobs)
+    return jobs
+
+
+def run_pyav(planned, args, journal):
+    jobs_limit = args.jobs or engine.default_job_count()
+    profile = engine.build_encoding_profile(
+        QUALITY_CHOICES[args.quality], args.preset, args.threads, concurrent_jobs=min(jobs_limit, len(planned)),
+        scaler=args.scaler,
+    )
+    jobs = [
+        engine.build_job(row, input_file, output_file, metadata, analysis.SCALE_MAP.get(args.resolution), action,
+                         args.copy_subs, args.chunk, profile)
+        for row, input_file, output_file, metadata, action in planned
+    ]
+    for job, (_, _, _, metadata, _) in zip(jobs, planned):
+        total_bit_rate = target_bit_rate(metadata, args)
+        if total_bit_rate and job['action'] != analysis.REMUX:
+            video_bit_rate = analysis.video_bit_rate_for_target(total_bit_rate, analysis.source_audio_bit_rate(metadata))
+            job['profile'] = dict(profile, bit_rate=video_bit_rate)
+    jobs = resume_jobs(jobs, journal, args, engine.get_video_metadata)
+    interactive = sys.stdout.isatty()
+
+    def on_batch_progress(stats):
+        if interactive:
+            print(f"\r[{stats['percent']:3}%] {engine.format_stats(stats)}   ", end="", flush=True)
+
+    def on_log(line):
+        if interactive:
+            print("\r", end="")
+        print(line, flush=True)
+
+    def on_job_stats(report):
+        on_log(f"Stats for {os.path.basename(report['input_file'])}: {report['fps']} fps, "
+               f"{format_stage_breakdown(report)}")
+
+    report_dir = None
+    if args.stats or args.profile:
+        report_dir = args.report_dir or default_report_dir()
+    io = IOScheduler(jobs, prefetch=args.prefetch, scratch_dir=args.scratch_dir,
+                     readers_per_volume=args.readers_per_volume, on_log=on_log, prefetch_ahead=jobs_limit)
+    batch = engine.BatchCompressor(jobs, jobs_limit, on_log=on_log, on_batch_progress=on_batch_progress,
+                                   progress_interval=0.5, journal=journal,
+                                   on_job_stats=on_job_stats if args.stats else None,
+                                   report_dir=report_dir, profile_jobs=args.profile, io=io)
+    failed = batch.run()
+    if interactive:
+        print()
+    return failed
+
+
+def run_ffmpeg(planned, args, journal):
+    crf = analysis.QUALITY_CRF[QUALITY_CHOICES[args.quality]]
+    resolution = analysis.SCALE_MAP.get(args.resolution)
+    jobs = []
+    for row, input_file, output_file, metadata, action in planned:
+        video_bit_rate = None
+        total_bit_rate = target_bit_rate(metadata, args)
+        if total_bit_rate:
+            audio_bit_rate = ffmpeg_tools.FFMPEG_AUDIO_BIT_RATE if metadata.get('audio_streams') else 0
+            video_bit_rate = analysis.video_bit_rate_for_target(total_bit_rate, audio_bit_rate)
+        jobs.append(ffmpeg_tools.build_ffmpeg_job(
+            row, input_file, output_file, metadata, crf, resolution, args.preset, action == analysis.REMUX,
+            video_bit_rate, args.scaler,
+        ))
+    jobs = resume_jobs(jobs, journal, args, ffmpeg_tools.get_video_metadata)
+
+    def on_log(line):
+        if args.verbose or not line.startswith("["):
+            print(line, flush=True)
+
+    return ffmpeg_tools.run_ffmpeg_jobs(jobs, args.jobs or None, on_log=on_log, journal=journal)
+
+
+def run_batch(files, args, probe, journal):
+    """Compress ``files`` and return the ones that were neither compressed nor skipped."""
+    skipped = []
+    planned = plan_jobs(files, args, probe, skipped)
+    failed = run_ffmpeg(planned, args, journal) if args.engine == "ffmpeg" else run_pyav(planned, args, journal)
+    print(f"Done: {len(planned) - len(failed)} of {len(planned)} file(s) compressed.")
+    # plan_jobs also drops files it could not read, which count as failed.
+    handled = {input_file for _, input_file, _, _, _ in planned}.union(skipped)
+    return [job['input_file'] for job in failed] + [file for file in files if file not in handled]
+
+
+def watch(folders, args, probe, journal):
+    index = WatchIndex()
+    watchers = [FolderWatcher(folder, index, args.settle, exclude=[args.output_dir]) for folder in folders]
+    print(f"Watching {', '.join(folders)} for new videos (Ctrl+C to stop)")
+    try:
+        while True:
+            for watcher in watchers:
+                files = watcher.poll()
+                if not files:
+                    continue
+                print(f"Watch folder: {len(files)} new file(s)")
+                failed = set(run_batch(files, args, probe, journal))
+                for file in files:
+                    if file not in failed:
+                        watcher.done(file)
+            time.sleep(args.poll)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        index.close()
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.version:
+        print(f"Video Compressor v{engine.__version__}")
+        return 0
+    if not args.inputs or not args.output_dir:
+        parser.error("inputs and --output-dir are required")
+    if not os.path.isdir(args.output_dir):
+        parser.error(f"output folder does not exist: {args.output_dir}")
+
+    probe = ffmpeg_tools.get_video_metadata if args.engine == "ffmpeg" else engine.get_video_metadata
+    journal = JobJournal(f"cli-{args.engine}")
+    if args.watch:
+        # Files already in the folders are picked up by the first poll.
+        folders = [path for path in args.inputs if os.path.isdir(path)]
+        if not folders:
+            parser.error("--watch needs at least one input folder")
+        if any(same_folder(folder, args.output_dir) for folder in folders):
+            parser.error("--output-dir must not be one of the watched folders")
+        return watch(folders, args, probe, journal)
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        print("No input files found.")
+        return 1
+    failed = run_batch(files, args, probe, journal)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    # Segment workers are started with "spawn" and need this in frozen builds.
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,992 @@
+__version__ = "0.0.23"
+
+import bisect
+import cProfile
+import heapq
+import multiprocessing
+import os
+import pstats
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+import av
+import av.filter
+from av.codec.context import Flags
+
+import analysis
+from formatting import format_duration
+from job_io import IOScheduler, split_duplicate_outputs
+from job_journal import DONE, FAILED, RUNNING, finalize_output, prepare_partial_output
+from job_stats import JobStats, default_report_dir, report_path, write_report
+
+
+FORMATS = ["mp4", "avi", "mov", "mkv"]
+
+
+def sanitize_filename(name):
+    return re.sub(r'[<>:"/\\|?*]', "_", name)
+
+
+def get_video_metadata(filepath):
+    with av.open(filepath) as container:
+        video_stream = next(s for s in container.streams if s.type == "video")
+        if video_stream.duration is not None:
+            duration = float(video_stream.duration * video_stream.time_base)
+        elif container.duration is not None:
+            duration = container.duration / av.time_base
+        else:
+            duration = None
+        fps = float(video_stream.average_rate) if video_stream.average_rate else None
+        frames = video_stream.frames
+        if not frames and duration and fps:
+            frames = int(duration * fps)
+        return {
+            'width': video_stream.width,
+            'height': video_stream.height,
+            'duration': duration,
+            'video_codec': video_stream.codec_context.name,
+            'pix_fmt': video_stream.codec_context.pix_fmt,
+            'fps': fps,
+            'frames': frames,
+            'video_bit_rate': video_stream.bit_rate,
+            'bit_rate': container.bit_rate,
+            'audio_streams': [
+                {
+                    'codec': s.codec_context.name,
+                    'channels': s.codec_context.channels,
+                    'sample_rate': s.sample_rate,
+                    'bit_rate': s.bit_rate,
+                }
+                for s in container.streams.audio
+            ],
+        }
+
+
+def default_job_count():
+    return os.cpu_count() or 1
+
+
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+
+
+def auto_thread_count(concurrent_jobs):
+    # Split the cores between the jobs that run at the same time so that
+    # parallel jobs don't oversubscribe the machine.
+    return max(1, default_job_count() // max(concurrent_jobs, 1))
+
+
+def build_encoding_profile(quality="Medium Quality", preset="fast", threads=0, concurrent_jobs=1,
+                           scaler=analysis.DEFAULT_SCALER):
+    return {
+        'crf': analysis.QUALITY_CRF[quality],
+        'preset': preset,
+        'threads': threads or auto_thread_count(concurrent_jobs),
+        'scaler': scaler,
+    }
+
+
+def configure_decoder(stream, threads):
+    stream.thread_type = "AUTO"  # frame and slice threading
+    stream.codec_context.thread_count = threads
+
+
+def encoder_options(profile, stats_file=None):
+    if profile.get('bit_rate'):
+        # Two-pass: both passes share the rate control stats file.
+        return {'preset': profile['preset'], 'stats': stats_file}
+    return {'crf': str(profile['crf']), 'preset': profile['preset']}
+
+
+def job_passes(job):
+    profile = job.get('profile') or {}
+    return 2 if profile.get('bit_rate') and job.get('action') != analysis.REMUX else 1
+
+
+def add_video_encoder(out_container, in_stream, profile, resolution=None, stats_file=None):
+    out_stream = out_container.add_stream(
+        "libx264",
+        rate=in_stream.average_rate,
+        options=encoder_options(profile, stats_file),
+    )
+    out_stream.codec_context.thread_count = profile['threads']
+    out_stream.width, out_stream.height = analysis.fit_resolution(in_stream.width, in_stream.height, resolution)
+    out_stream.pix_fmt = "yuv420p"
+    if profile.get('bit_rate'):
+        out_stream.codec_context.bit_rate = profile['bit_rate']
+        out_stream.codec_context.flags |= Flags.pass2
+    return out_stream
+
+
+def create_first_pass_encoder(in_stream, profile, resolution, stats_file):
+    """A bare libx264 encoder for the analysis pass of a two-pass encode.
+
+    Its packets are thrown away, so it has no container. libx264 applies
+    its fast first pass settings, which makes this pass a fraction of the
+    cost of the real encode.
+    """
+    codec_context = av.CodecContext.create("libx264", "w")
+    codec_context.framerate = in_stream.average_rate
+    codec_context.time_base = 1 / in_stream.average_rate
+    codec_context.options = encoder_options(profile, stats_file)
+    codec_context.thread_count = profile['threads']
+    codec_context.width, codec_context.height = analysis.fit_resolution(in_stream.width, in_stream.height, resolution)
+    codec_context.pix_fmt = "yuv420p"
+    codec_context.bit_rate = profile['bit_rate']
+    codec_context.flags |= Flags.pass1
+    return codec_context
+
+
+def encode_first_pass(in_stream, frames, profile, resolution, stats_file):
+    encoder = create_first_pass_encoder(in_stream, profile, resolution, stats_file)
+    scaler = FrameScaler(encoder.width, encoder.height, profile.get('scaler'))
+    for frame in frames:
+        encoder.encode(scaler(frame))
+    encoder.encode(None)
+    # libx264 only writes out the stats file when the encoder is freed.
+    del encoder
+
+
+class FrameScaler:
+    """Scales decoded frames to the encoder's size and yuv420p in one libswscale pass.
+
+    The filter graph (buffer -> scale -> format -> buffersink) is built for
+    the first frame and rebuilt only if the input size or pixel format
+    changes mid-stream. Frames that already match go straight through.
+    """
+
+    def __init__(self, width, height, algorithm=None, pix_fmt="yuv420p"):
+        self.width = width
+        self.height = height
+        self.algorithm = algorithm or analysis.DEFAULT_SCALER
+        self.pix_fmt = pix_fmt
+        self.input_key = None
+        self.graph = self.source = self.sink = None
+
+    def _build(self, frame):
+        # The filter contexts don't keep their graph alive, so hold on to it.
+        self.graph = av.filter.Graph()
+        self.source = self.graph.add_buffer(width=frame.width, height=frame.height, format=frame.format.name,
+                                            time_base=frame.time_base)
+        scale = self.graph.add("scale", f"{self.width}:{self.height}:flags={self.algorithm}")
+        pix_fmt = self.graph.add("format", self.pix_fmt)
+        self.sink = self.graph.add("buffersink")
+        self.source.link_to(scale)
+        scale.link_to(pix_fmt)
+        pix_fmt.link_to(self.sink)
+        self.graph.configure()
+        self.input_key = (frame.width, frame.height, frame.format.name)
+
+    def __call__(self, frame):
+        key = (frame.width, frame.height, frame.format.name)
+        if key == (self.width, self.height, self.pix_fmt):
+            return frame
+        if key != self.input_key:
+            self._build(frame)
+        self.source.push(frame)
+        return self.sink.pull()
+
+
+CHUNK_MIN_DURATION = 10 * 60
+MIN_SEGMENT_SECONDS = 30
+
+
+def find_segment_boundaries(input_file, segment_count):
+    """Split the first video stream at keyframes into about ``segment_count`` parts.
+
+    Only packets are read, nothing is decoded. Returns a list of
+    ``(start_pts, end_pts)`` in the stream time base; the first start and
+    the last end are None (start/end of file).
+    """
+    with av.open(input_file) as container:
+        stream = next(s for s in container.streams if s.type == "video")
+        keyframes = sorted(p.pts for p in container.demux(stream) if p.is_keyframe and p.pts is not None)
+    if segment_count < 2 or len(keyframes) < 2:
+        return [(None, None)]
+    first, last = keyframes[0], keyframes[-1]
+    starts = []
+    for i in range(1, segment_count):
+        target = first + (last - first) * i // segment_count
+        pos = min(bisect.bisect_left(keyframes, target), len(keyframes) - 1)
+        if pos > 0 and target - keyframes[pos - 1] < keyframes[pos] - target:
+            pos -= 1
+        if keyframes[pos] > first and keyframes[pos] not in starts:
+            starts.append(keyframes[pos])
+    bounds = [None] + starts + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _count_packet(counters, packet):
+    if counters is not None and packet.size:
+        counters['packets_in'] += 1
+        counters['bytes_in'] += packet.size
+
+
+def _demux_decode(in_container, in_stream, start_pts, end_pts, counters):
+    for packet in in_container.demux(in_stream):
+        # Decoding reads a few packets past end_pts, which the next segment counts.
+        after_start = packet.pts is None or start_pts is None or packet.pts >= start_pts
+        before_end = packet.pts is None or end_pts is None or packet.pts < end_pts
+        if after_start and before_end:
+            _count_packet(counters, packet)
+        yield from packet.decode()
+
+
+def _decode_range(in_container, in_stream, start_pts, end_pts, progress_queue, counters=None):
+    if start_pts is not None:
+        # start_pts is a keyframe, so a backward seek lands exactly on it.
+        in_container.seek(start_pts, stream=in_stream)
+    pending = 0
+    for frame in _demux_decode(in_container, in_stream, start_pts, end_pts, counters):
+        if frame.pts is not None:
+            if start_pts is not None and frame.pts < start_pts:
+                continue
+            if end_pts is not None and frame.pts >= end_pts:
+                break
+        yield frame
+        pending += 1
+        if pending >= 25:
+            progress_queue.put(pending)
+            pending = 0
+    progress_queue.put(pending)
+
+
+def encode_segment(input_file, segment_file, start_pts, end_pts, resolution, profile, progress_queue,
+                   profile_file=None):
+    """Encode the video frames in ``[start_pts, end_pts)`` to ``segment_file``.
+
+    Runs in a worker process. Frames keep their source timestamps, and the
+    pts of the first encoded frame is returned so the segments can be
+    stitched back together exactly. Progress is reported as frame counts on
+    ``progress_queue``. A profile with a ``bit_rate`` runs both passes of a
+    two-pass encode over the segment. Returns ``(first_pts, stats)`` where
+    ``stats`` is a ``JobStats.as_dict()`` for the segment; its ``decode``
+    stage includes demuxing. With a ``profile_file`` the segment runs under
+    cProfile and the stats are saved there.
+    """
+    if profile_file:
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(encode_segment, input_file, segment_file, start_pts, end_pts, resolution,
+                                    profile, progress_queue)
+        finally:
+            profiler.dump_stats(profile_file)
+    stats = JobStats()
+    clock = time.perf_counter
+    stats_file = None
+    if profile.get('bit_rate'):
+        started = clock()
+        stats_file = segment_file + ".stats"
+        with av.open(input_file) as in_container:
+            in_stream = next(s for s in in_container.streams if s.type == "video")
+            configure_decoder(in_stream, profile['threads'])
+            frames = _decode_range(in_container, in_stream, start_pts, end_pts, progress_queue)
+            encode_first_pass(in_stream, frames, profile, resolution, stats_file)
+        stats.stages['first_pass'] += clock() - started
+
+    first_pts = None
+    with av.open(input_file) as in_container, av.open(segment_file, mode="w") as out_container:
+        in_stream = next(s for s in in_container.streams if s.type == "video")
+        configure_decoder(in_stream, profile['threads'])
+        out_stream = add_video_encoder(out_container, in_stream, profile, resolution, stats_file)
+        scaler = FrameScaler(out_stream.width, out_stream.height, profile.get('scaler'))
+        frames = _decode_range(in_container, in_stream, start_pts, end_pts, progress_queue, stats.counters)
+        for frame in stats.timed("decode", frames):
+            stats.counters['frames'] += 1
+            if first_pts is None and frame.pts is not None:
+                first_pts = frame.pts
+            started = clock()
+            frame = scaler(frame)
+            stats.stages['reformat'] += clock() - started
+            started = clock()
+            out_packets = out_stream.encode(frame)
+            stats.stages['encode'] += clock() - started
+            started = clock()
+            for out_packet in out_packets:
+                out_container.mux(out_packet)
+            stats.stages['mux'] += clock() - started
+        started = clock()
+        out_packets = out_stream.encode()
+        stats.stages['encode'] += clock() - started
+        started = clock()
+        for out_packet in out_packets:
+            out_container.mux(out_packet)
+        stats.stages['mux'] += clock() - started
+    return first_pts, stats.as_dict()
+
+
+def _packet_time(packet):
+    ts = packet.dts if packet.dts is not None else packet.pts
+    return float((ts or 0) * packet.time_base)
+
+
+def _segment_packets(segments, in_time_base, out_stream):
+    last_dts = None
+    for segment_file, first_pts in segments:
+        with av.open(segment_file) as container:
+            stream = container.streams.video[0]
+            offset = None
+            for packet in container.demux(stream):
+                if packet.dts is None:
+                    continue
+                if offset is None:
+                    # Re-anchor the segment on its source timestamp in case
+                    # the intermediate container shifted it.
+                    expected = int(round(first_pts * in_time_base / stream.time_base)) if first_pts is not None else packet.pts
+                    offset = expected - packet.pts
+                packet.pts += offset
+                packet.dts += offset
+                if last_dts is not None and packet.dts <= last_dts:
+                    packet.dts = last_dts + 1
+                last_dts = packet.dts
+                packet.stream = out_stream
+                yield packet
+
+
+def _passthrough_packets(in_container, copy_map, encode_map, counters=None):
+    streams = [s for s in in_container.streams if s.index in copy_map or s.index in encode_map]
+    if not streams:
+        return
+    for packet in in_container.demux(*streams):
+        _count_packet(counters, packet)
+        index = packet.stream.index
+        if index in copy_map:
+            if packet.dts is None:
+                continue
+            packet.stream = copy_map[index]
+            yield packet
+        else:
+            for frame in packet.decode():
+                yield from encode_map[index].encode(frame)
+    for out_stream in encode_map.values():
+        yield from out_stream.encode()
+
+
+AUDIO_FALLBACK_CODECS = ("aac", "mp3", "ac3", "pcm_s16le")
+
+
+def add_passthrough_streams(in_container, out_container, copy_extra_streams=False):
+    """Add output streams for the audio (and optionally subtitle/data) streams.
+
+    Returns ``(copy_map, encode_map, skipped)``: input stream index to output
+    stream for packets that can be remuxed as-is, input stream index to
+    output stream for audio that has to be re-encoded, and a list of
+    ``(stream, reason)`` for streams left out.
+    """
+    supported = out_container.supported_codecs
+    copy_map, encode_map, skipped = {}, {}, []
+    for stream in in_container.streams:
+        if stream.type == "audio":
+            if stream.codec_context.name in supported:
+                copy_map[stream.index] = out_container.add_stream_from_template(stream)
+                continue
+            codec = next((c for c in AUDIO_FALLBACK_CODECS if c in supported), None)
+            if codec is None:
+                skipped.append((stream, "no audio codec supported by the output format"))
+                continue
+            encode_map[stream.index] = out_container.add_stream(
+                codec, rate=stream.codec_context.sample_rate, layout=stream.codec_context.layout.name
+            )
+        elif stream.type in ("subtitle", "data") and copy_extra_streams:
+            if stream.codec_context.name not in supported:
+                skipped.append((stream, f"{stream.codec_context.name} is not supported by the output format"))
+                continue
+            try:
+                copy_map[stream.index] = out_container.add_stream_from_template(stream)
+            except Exception as e:
+                skipped.append((stream, str(e)))
+    return copy_map, encode_map, skipped
+
+
+class _SsimMeter:
+    """Compares pairs of same-sized yuv420p frames with libavfilter's ssim."""
+
+    def __init__(self, width, height, time_base):
+        self.graph = av.filter.Graph()
+        self.main = self.graph.add_buffer(width=width, height=height, format="yuv420p", time_base=time_base)
+        self.reference = self.graph.add_buffer(width=width, height=height, format="yuv420p", time_base=time_base)
+        ssim = self.graph.add("ssim")
+        self.sink = self.graph.add("buffersink")
+        self.main.link_to(ssim, 0, 0)
+        self.reference.link_to(ssim, 0, 1)
+        ssim.link_to(self.sink)
+        self.graph.configure()
+        self.total = 0.0
+        self.frames = 0
+
+    def add(self, frame, reference):
+        self.main.push(frame)
+        self.reference.push(reference)
+        self.total += float(self.sink.pull().metadata['lavfi.ssim.All'])
+        self.frames += 1
+
+
+def _encode_sample(container, in_stream, start, length, profile, resolution):
+    width, height = analysis.fit_resolution(in_stream.width, in_stream.height, resolution)
+    scaler = FrameScaler(width, height, profile.get('scaler'))
+    time_base = 1 / in_stream.average_rate
+    encoder = av.CodecContext.create("libx264", "w")
+    encoder.framerate = in_stream.average_rate
+    encoder.time_base = time_base
+    encoder.width, encoder.height, encoder.pix_fmt = width, height, "yuv420p"
+    encoder.thread_count = profile['threads']
+    if profile.get('bit_rate'):
+        # One ABR pass is close enough to the two-pass result for an estimate.
+        encoder.options = {'preset': profile['preset']}
+        encoder.bit_rate = profile['bit_rate']
+    else:
+        encoder.options = {'crf': str(profile['crf']), 'preset': profile['preset']}
+    decoder = av.CodecContext.create("h264", "r")
+    meter = _SsimMeter(width, height, time_base)
+    references = {}
+    video_bytes = frames = 0
+    measuring = 0.0
+
+    def measure(packets):
+        # Decode the encoder's output and score it against the source frames.
+        nonlocal video_bytes, measuring
+        mark = time.perf_counter()
+        for packet in packets or ():
+            video_bytes += packet.size
+            for decoded in decoder.decode(packet):
+                meter.add(decoded, references.pop(decoded.pts))
+        if packets is None:
+            for decoded in decoder.decode(None):
+                meter.add(decoded, references.pop(decoded.pts))
+        measuring += time.perf_counter() - mark
+
+    container.seek(int(start / in_stream.time_base), stream=in_stream)
+    started = None
+    for frame in container.decode(in_stream):
+        if frame.time is None or frame.time < start:
+            continue
+        if frame.time >= start + length:
+            break
+        if started is None:
+            started = time.perf_counter()
+        frame = scaler(frame)
+        frame.pts, frame.time_base = frames, time_base
+        references[frames] = frame
+        frames += 1
+        measure(encoder.encode(frame))
+    measure(encoder.encode(None))
+    measure(None)
+    busy = time.perf_counter() - started - measuring if started is not None else 0.0
+    return frames, video_bytes, busy, meter
+
+
+def estimate_job(input_file, metadata, profile, resolution=None, samples=analysis.ESTIMATE_SAMPLES,
+                 sample_seconds=analysis.ESTIMATE_SAMPLE_SECONDS):
+    """Encode a few short slices spread over a file and project the full encode.
+
+    Returns ``{'size', 'seconds', 'ssim'}``: the projected output size in
+    bytes including audio, the encode time with ``profile['threads']``
+    threads, and the mean SSIM of the slices against the source scaled to
+    the output size.
+    """
+    if not metadata.get('duration'):
+        raise ValueError("unknown duration")
+    frames = video_bytes = 0
+    encode_seconds = ssim_total = 0.0
+    ssim_frames = 0
+    with av.open(input_file) as container:
+        in_stream = next(s for s in container.streams if s.type == "video")
+        configure_decoder(in_stream, profile['threads'])
+        for start, length in analysis.sample_windows(metadata['duration'], samples, sample_seconds):
+            sample_frames, sample_bytes, busy, meter = _encode_sample(
+                container, in_stream, start, length, profile, resolution
+            )
+            frames += sample_frames
+            video_bytes += sample_bytes
+            encode_seconds += busy
+            ssim_total += meter.total
+            ssim_frames += meter.frames
+        fps = float(in_stream.average_rate or 0) or metadata.get('fps') or 30
+    if not frames:
+        raise ValueError("no frames decoded")
+    return analysis.project_estimate(
+        metadata['duration'], frames / fps, video_bytes, encode_seconds,
+        ssim_total / ssim_frames if ssim_frames else None, analysis.source_audio_bit_rate(metadata),
+    )
+
+
+def format_stats(stats):
+    speed = f"{stats['speed']:.1f}x" if stats['speed'] else "?x"
+    return f"{stats['fps']:.0f} fps, {speed}, ETA {format_duration(stats['eta'])}"
+
+
+class ProgressReporter:
+    """Coalesces per-frame progress into throttled per-file and batch updates.
+
+    An update is passed on when ``interval`` seconds have gone by since the
+    last one for the same file (or batch), or when its percentage has moved
+    by at least ``percent_step``. Callbacks run on the calling thread.
+    """
+
+    def __init__(self, total_frames, on_file, on_batch, interval=0.1, percent_step=5):
+        self.total_frames = max(total_frames, 1)
+        self.on_file = on_file
+        self.on_batch = on_batch
+        self.interval = interval
+        self.percent_step = percent_step
+        self.frames_done = 0
+        self.media_seconds_done = 0.0
+        self.batch_start = time.monotonic()
+        self.batch_state = {'last_emit': 0.0, 'last_percent': -1}
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def start_file(self, row, total_frames, fps=None):
+        with self._lock:
+            self.files[row] = {
+                'start': time.monotonic(),
+                'frames': 0,
+                'total': max(total_frames, 1),
+                'fps': fps,
+                'last_emit': 0.0,
+                'last_percent': -1,
+            }
+
+    def advance(self, row, count=1):
+        now = time.monotonic()
+        with self._lock:
+            state = self.files[row]
+            self._add_frames(state, count)
+            file_stats = self._file_stats(state, now)
+            batch_stats = self._batch_stats(now)
+        if file_stats:
+            self.on_file(row, file_stats)
+        if batch_stats:
+            self.on_batch(batch_stats)
+
+    def finish_file(self, row):
+        now = time.monotonic()
+        with self._lock:
+            state = self.files.pop(row)
+            # Header frame counts are estimates; settle this file's share of
+            # the total so the batch ends at 100% whatever order files finish.
+            remaining = state['total'] - state['frames']
+            if remaining > 0:
+                self._add_frames(state, remaining, count_for_file=False)
+            file_stats = self._file_stats(state, now, force=True)
+            file_stats['percent'] = 100
+            file_stats['eta'] = 0
+            batch_stats = self._batch_stats(now, force=True)
+        self.on_file(row, file_stats)
+        self.on_batch(batch_stats)
+
+    def _add_frames(self, state, count, count_for_file=True):
+        if count_for_file:
+            state['frames'] += count
+        self.frames_done += count
+        if state['fps']:
+            self.media_seconds_done += count / state['fps']
+
+    def _should_emit(self, state, percent, now, force):
+        if not force and now - state['last_emit'] < self.interval and percent < state['last_percent'] + self.percent_step:
+            return False
+        state['last_emit'] = now
+        state['last_percent'] = percent
+        return True
+
+    def _file_stats(self, state, now, force=False):
+        percent = min(int(state['frames'] * 100 / state['total']), 100)
+        if not self._should_emit(state, percent, now, force):
+            return None
+        fps = state['frames'] / max(now - state['start'], 1e-6)
+        return {
+            'percent': percent,
+            'fps': fps,
+            'speed': fps / state['fps'] if state['fps'] else None,
+            'eta': (state['total'] - state['frames']) / fps if fps else None,
+        }
+
+    def _batch_stats(self, now, force=False):
+        frames_done = min(self.frames_done, self.total_frames)
+        percent = int(frames_done * 100 / self.total_frames)
+        if not self._should_emit(self.batch_state, percent, now, force):
+            return None
+        elapsed = max(now - self.batch_start, 1e-6)
+        fps = frames_done / elapsed
+        return {
+            'frames_done': frames_done,
+            'total_frames': self.total_frames,
+            'percent': percent,
+            'fps': fps,
+            'speed': self.media_seconds_done / elapsed,
+            'eta': (self.total_frames - frames_done) / fps if fps else None,
+        }
+
+
+def make_output_path(input_file, output_dir, format_ext):
+    name, _ = os.path.splitext(sanitize_filename(os.path.basename(input_file)))
+    output_file = os.path.normpath(os.path.join(output_dir, f"{name}_compressed.{format_ext}"))
+    if len(output_file) > 250:
+        output_file = os.path.normpath(os.path.join(output_dir, f"{name[:30]}_compressed.{format_ext}"))
+    return output_file
+
+
+def build_job(row, input_file, output_file, metadata, resolution=None, action=analysis.ENCODE,
+              copy_extra_streams=False, chunk_long_videos=False, profile=None):
+    return {
+        'row': row,
+        'input_file': input_file,
+        'output_file': output_file,
+        'resolution': resolution,
+        'total_frames': metadata['frames'] or 1,
+        'fps': metadata['fps'],
+        'copy_extra_streams': copy_extra_streams,
+        'action': action,
+        'duration': metadata['duration'],
+        'audio_bit_rate': analysis.source_audio_bit_rate(metadata),
+        'chunked': chunk_long_videos and (metadata['duration'] or 0) >= CHUNK_MIN_DURATION,
+        'profile': profile,
+    }
+
+
+class BatchCompressor:
+    """Runs a batch of PyAV compression jobs without any GUI.
+
+    Jobs are dicts as built by ``build_job``. Up to ``max_workers`` jobs run
+    at once; progress goes to ``on_file_progress(row, stats)`` and
+    ``on_batch_progress(stats)`` through a ProgressReporter, and log lines
+    to ``on_log``. All callbacks may be called from worker threads.
+
+    Each job is written to a hidden partial file next to its output and
+    only renamed into place once it has finished, so an interrupted batch
+    never leaves a truncated output behind. When a ``journal`` is given,
+    job states are recorded in it as they change.
+
+    Every job times its demux/decode/reformat/encode/mux stages (see
+    ``JobStats``). The finished report is passed to ``on_job_stats(report)``
+    and, with a ``report_dir``, written there as JSON. ``profile_jobs``
+    also runs each job under cProfile and saves the ``.prof`` file next to
+    the report; only one job is profiled at a time.
+
+    Before a job starts, ``io`` (an ``IOScheduler``, by default one that
+    only checks free space) must find room for its estimated output, and
+    the job then reads its input through ``io.open_input``, which may hand
+    out a prefetched local copy.
+
+    ``on_job_finished(job, ok)`` is called from ``run``'s thread as each
+    job ends.
+    """
+
+    def __init__(self, jobs, max_workers=None, on_log=print, on_file_progress=None, on_batch_progress=None,
+                 progress_interval=0.1, journal=None, on_job_stats=None, report_dir=None, profile_jobs=False,
+                 io=None, on_job_finished=None):
+        self.jobs = jobs
+        self.on_job_finished = on_job_finished
+        self.io = io or IOScheduler(jobs, on_log=on_log)
+        self.journal = journal
+        self.on_job_stats = on_job_stats
+        self.profile_jobs = profile_jobs
+        self.report_dir = report_dir or (default_report_dir() if profile_jobs else None)
+        self._profile_lock = threading.Lock()
+        self.max_workers = max(1, max_workers or default_job_count())
+        self.total_frames = sum(job['total_frames'] * job_passes(job) for job in jobs)
+        self.on_log = on_log
+        self.reporter = ProgressReporter(
+            self.total_frames,
+            on_file_progress or (lambda row, stats: None),
+            on_batch_progress or (lambda stats: None),
+            interval=progress_interval,
+        )
+
+    def run(self):
+        """Run every job and return the list of jobs that failed."""
+        # PyAV releases the GIL inside decode/encode, so a thread per job keeps
+        # several encoders busy without the cost of pickling jobs to processes.
+        failed = []
+        jobs, duplicates = split_duplicate_outputs(self.jobs)
+        for job, first in duplicates:
+            # Two jobs writing one output would clobber each other's partial file.
+            self.fail_job(job, f"[ERROR] {job['input_file']} would overwrite the output of {first['input_file']}: "
+                               f"{job['output_file']}, skipping it")
+            failed.append(job)
+            if self.on_job_finished:
+                self.on_job_finished(job, False)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {pool.submit(self.compress_job, job): job for job in jobs}
+                for future in as_completed(futures):
+                    ok = future.result()
+                    if not ok:
+                        failed.append(futures[future])
+                    if self.on_job_finished:
+                        self.on_job_finished(futures[future], ok)
+        finally:
+            self.io.close()
+        return failed
+
+    def _mux(self, out_container, packet, stats, warning=None, strict=False):
+        size = packet.size
+        started = time.perf_counter()
+        try:
+            out_container.mux(packet)
+            stats.counters['packets_out'] += 1
+            stats.counters['bytes_out'] += size
+        except Exception as mux_err:
+            if strict:
+                raise
+            stats.counters['mux_warnings'] += 1
+            self.on_log(f"[WARNING] {warning or f'muxing {packet.stream.type} packet failed (PTS={packet.pts})'}: {mux_err}")
+        stats.stages['mux'] += time.perf_counter() - started
+
+    def fail_job(self, job, message):
+        """Fail ``job`` without running it."""
+        self.io.skip_input(job)
+        self.on_log(message)
+        self.reporter.start_file(job['row'], job['total_frames'] * job_passes(job))
+        self.reporter.finish_file(job['row'])
+        if self.journal:
+            self.journal.set_state(job, FAILED)
+
+    def compress_job(self, job):
+        no_space = self.io.reserve_output(job)
+        if no_space:
+            self.fail_job(job, f"[ERROR] Not enough disk space for {job['output_file']}: {no_space}")
+            return False
+        if self.journal:
+            self.journal.set_state(job, RUNNING)
+        remux = job.get('action') == analysis.REMUX
+        stats = JobStats()
+        profiler = segment_profiles = None
+        if self.profile_jobs:
+            if self._profile_lock.acquire(blocking=False):
+                profiler = cProfile.Profile()
+                profiler.enable()
+                segment_profiles = []
+            else:
+                self.on_log(f"[WARNING] Another job is being profiled, not profiling {os.path.basename(job['input_file'])}")
+        try:
+            partial_file = prepare_partial_output(job['output_file'])
+            with self.io.open_input(job) as input_file:
+                # The journal and reports keep the original path, only the encoder reads the copy.
+                source = job if input_file == job['input_file'] else dict(job, input_file=input_file)
+                if job.get('chunked') and not remux:
+                    ok = self.compress_job_chunked(source, partial_file, stats, segment_profiles)
+                else:
+                    ok = self.compress_job_single(source, partial_file, stats)
+            finalize_output(job['output_file'], ok)
+        except OSError as e:
+            self.on_log(f"[ERROR] Writing {job['output_file']}: {e}")
+            ok = False
+        finally:
+            self.io.release_output(job)
+            if profiler:
+                profiler.disable()
+                self._profile_lock.release()
+        if ok:
+            self.on_log(f"✅ {'Remuxed' if remux else 'Finished'}: {job['output_file']}")
+        if self.journal:
+            self.journal.set_state(job, DONE if ok else FAILED)
+        self.report_job(job, ok, stats, profiler, segment_profiles)
+        return ok
+
+    def report_job(self, job, ok, stats, profiler=None, segment_profiles=None):
+        if not self.on_job_stats and not self.report_dir:
+            return
+        profile_file = None
+        try:
+            if profiler:
+                os.makedirs(self.report_dir, exist_ok=True)
+                profile_file = report_path(self.report_dir, job, ".prof")
+                # Chunked jobs encode in worker processes; fold their profiles into the parent's.
+                profile_stats = pstats.Stats(profiler)
+                for segment_stats in segment_profiles or []:
+                    profile_stats.add(segment_stats)
+                profile_stats.dump_stats(profile_file)
+            report = stats.report(job, ok, profile_file)
+            if self.report_dir:
+                write_report(self.report_dir, report)
+        except OSError as e:
+            self.on_log(f"[WARNING] Could not write job report: {e}")
+            report = stats.report(job, ok)
+        if self.on_job_stats:
+            self.on_job_stats(report)
+
+    def run_first_pass(self, job, profile, stats_file, stats):
+        started = time.perf_counter()
+        with av.open(job['input_file']) as in_container:
+            in_stream = next(s for s in in_container.streams if s.type == "video")
+            configure_decoder(in_stream, profile['threads'])
+            encode_first_pass(in_stream, self._counted(job, in_container.decode(in_stream)), profile,
+                              job['resolution'], stats_file)
+        stats.stages['first_pass'] += time.perf_counter() - started
+
+    def _counted(self, job, frames):
+        for frame in frames:
+            yield frame
+            self.reporter.advance(job['row'])
+
+    def compress_job_single(self, job, output_file, stats=None):
+        stats = stats or JobStats()
+        clock = time.perf_counter
+        in_container = out_container = None
+        stats_dir = stats_file = None
+        frame_count = 0
+        self.reporter.start_file(job['row'], job['total_frames'] * job_passes(job), job.get('fps'))
+        try:
+            if job_passes(job) == 2:
+                stats_dir = tempfile.mkdtemp(prefix="video_compressor_2pass_")
+                stats_file = os.path.join(stats_dir, "x264.log")
+                self.run_first_pass(job, job['profile'], stats_file, stats)
+            in_container = av.open(job['input_file'])
+            out_container = av.open(str(output_file), mode="w")
+            in_stream = next(s for s in in_container.streams if s.type == "video")
+            remux = job.get('action') == analysis.REMUX
+            if remux:
+                out_stream = out_container.add_stream_from_template(in_stream)
+            else:
+                profile = job.get('profile') or build_encoding_profile(concurrent_jobs=self.max_workers)
+                configure_decoder(in_stream, profile['threads'])
+                out_stream = add_video_encoder(out_container, in_stream, profile, job['resolution'], stats_file)
+                scaler = FrameScaler(out_stream.width, out_stream.height, profile.get('scaler'))
+
+            copy_map, encode_map, skipped = add_passthrough_streams(
+                in_container, out_container, job.get('copy_extra_streams', False)
+            )
+            if remux:
+                copy_map[in_stream.index] = out_stream
+            for stream, reason in skipped:
+                self.on_log(f"[WARNING] Dropping {stream.type} stream #{stream.index} of {job['input_file']}: {reason}")
+            demux_streams = [in_stream] + [s for s in in_container.streams if s.index in copy_map or s.index in encode_map]
+
+            for packet in stats.timed("demux", in_container.demux(*demux_streams)):
+                index = packet.stream.index
+                _count_packet(stats.counters, packet)
+                if index in copy_map:
+                    # Flush packets carry no timestamps and must not be muxed.
+                    if packet.dts is None:
+                        continue
+                    packet.stream = copy_map[index]
+                    self._mux(out_container, packet, stats)
+                    if index == in_stream.index:
+                        frame_count += 1
+                        self.reporter.advance(job['row'])
+                    continue
+                if index in encode_map:
+                    started = clock()
+                    out_packets = [p for audio_frame in packet.decode() for p in encode_map[index].encode(audio_frame)]
+                    stats.stages['audio'] += clock() - started
+                    for out_packet in out_packets:
+                        self._mux(out_container, out_packet, stats)
+                    continue
+                started = clock()
+                frames = packet.decode()
+                stats.stages['decode'] += clock() - started
+                for frame in frames:
+                    frame_count += 1
+                    started = clock()
+                    frame = scaler(frame)
+                    stats.stages['reformat'] += clock() - started
+                    started = clock()
+                    out_packets = out_stream.encode(frame)
+                    stats.stages['encode'] += clock() - started
+                    for out_packet in out_packets:
+                        self._mux(out_container, out_packet, stats,
+                                  f"muxing failed at frame {frame_count} (PTS={frame.pts or '?'})")
+                    self.reporter.advance(job['row'])
+
+            if not remux:
+                started = clock()
+                out_packets = out_stream.encode()
+                stats.stages['encode'] += clock() - started
+                for pkt in out_packets:
+                    self._mux(out_container, pkt, stats, strict=True)
+            for audio_stream in encode_map.values():
+                started = clock()
+                out_packets = audio_stream.encode()
+                stats.stages['audio'] += clock() - started
+                for pkt in out_packets:
+                    self._mux(out_container, pkt, stats, strict=True)
+            return True
+        except Exception as e:
+            self.on_log(f"[ERROR] Compressing {job['input_file']}: {e}")
+            return False
+        finally:
+            if in_container:
+                in_container.close()
+            if out_container:
+                out_container.close()
+            if stats_dir:
+                shutil.rmtree(stats_dir, ignore_errors=True)
+            stats.counters['frames'] += frame_count
+            self.reporter.finish_file(job['row'])
+
+    def compress_job_chunked(self, job, output_file, stats=None, segment_profiles=None):
+        stats = stats or JobStats()
+        self.reporter.start_file(job['row'], job['total_frames'] * job_passes(job), job.get('fps'))
+        profile = job.get('profile') or build_encoding_profile(concurrent_jobs=self.max_workers)
+        # Spread this job's share of the cores over single-threaded segment
+        # encoders; twice as many segments as workers evens out the tail.
+        workers = max(1, profile['threads'])
+        segment_profile = dict(profile, threads=1)
+        max_segments = max(1, int((job.get('duration') or 0) // MIN_SEGMENT_SECONDS))
+        segment_dir = tempfile.mkdtemp(prefix=".segments_", dir=os.path.dirname(os.path.abspath(job['output_file'])))
+        try:
+            bounds = find_segment_boundaries(job['input_file'], min(workers * 2, max_segments))
+            self.on_log(f"Encoding {os.path.basename(job['input_file'])} as {len(bounds)} segment(s) on {workers} process(es)")
+            segment_files = [os.path.join(segment_dir, f"{i:04}.mp4") for i in range(len(bounds))]
+
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Manager() as manager, ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                progress_queue = manager.Queue()
+                profile_files = [segment_file + ".prof" if segment_profiles is not None else None
+                                 for segment_file in segment_files]
+                futures = [
+                    pool.submit(encode_segment, job['input_file'], segment_file, start, end,
+                                job['resolution'], segment_profile, progress_queue, profile_file)
+                    for segment_file, profile_file, (start, end) in zip(segment_files, profile_files, bounds)
+                ]
+                pending = set(futures)
+                while pending:
+                    _, pending = wait(pending, timeout=0.1)
+                    self._drain_progress(job, progress_queue)
+                self._drain_progress(job, progress_queue)
+                first_pts = []
+                for future in futures:
+                    segment_pts, segment_stats = future.result()
+                    first_pts.append(segment_pts)
+                    stats.merge(segment_stats)
+                if segment_profiles is not None:
+                    segment_profiles.append(pstats.Stats(*profile_files))
+
+            self._concat_segments(job, output_file, list(zip(segment_files, first_pts)), stats)
+            return True
+        except Exception as e:
+            self.on_log(f"[ERROR] Compressing {job['input_file']}: {e}")
+            return False
+        finally:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+            self.reporter.finish_file(job['row'])
+
+    def _drain_progress(self, job, progress_queue):
+        frames = 0
+        while True:
+            try:
+                frames += progress_queue.get_nowait()
+            except queue.Empty:
+                break
+        if frames:
+            self.reporter.advance(job['row'], frames)
+
+    def _concat_segments(self, job, output_file, segments, stats):
+        with av.open(job['input_file']) as in_container, av.open(str(output_file), mode="w") as out_container:
+            in_stream = next(s for s in in_container.streams if s.type == "video")
+            with av.open(segments[0][0]) as first_segment:
+                out_stream = out_container.add_stream_from_template(first_segment.streams.video[0])
+            copy_map, encode_map, skipped = add_passthrough_streams(
+                in_container, out_container, job.get('copy_extra_streams', False)
+            )
+            for stream, reason in skipped:
+                self.on_log(f"[WARNING] Dropping {stream.type} stream #{stream.index} of {job['input_file']}: {reason}")
+            video_packets = _segment_packets(segments, in_stream.time_base, out_stream)
+            other_packets = _passthrough_packets(in_container, copy_map, encode_map, stats.counters)
+            for packet in heapq.merge(video_packets, other_packets, key=_packet_time):
+                self._mux(out_container, packet, stats)
@@ -1,32 +1,55 @@
 __version__ = "0.0.23"
 
 import os
-import subprocess
 import sys
+
+if __name__ == "__main__" and "--version" in sys.argv:
+    # Answered before the Qt imports below, so it works where PyQt5 is not installed.
+    print(f"Video Compressor v{__version__}")
+    sys.exit(0)
+
+from collections import deque
 from datetime import datetime
 
 import qdarkstyle
-from PyQt5.QtCore import QSettings, Qt
+from PyQt5.QtCore import QObject, QProcess, QSettings, Qt, pyqtSignal
 from PyQt5.QtWidgets import (
     QAction,
     QApplication,
+    QCheckBox,
     QComboBox,
     QFileDialog,
-    QHeaderView,
     QLabel,
     QLineEdit,
     QMainWindow,
     QMenuBar,
     QMessageBox,
     QPushButton,
-    QTableWidget,
-    QTableWidgetItem,
+    QSpinBox,
     QTextEdit,
     QVBoxLayout,
     QHBoxLayout,
     QWidget,
 )
 
+import analysis
+from ffmpeg_tools import (
+    FFMPEG_AUDIO_BIT_RATE,
+    build_ffmpeg_job,
+    default_job_count,
+    estimate_ffmpeg_encode,
+    get_video_metadata,
+    remove_passlog,
+)
+from file_table import FileTableModel, create_file_view
+from formatting import format_bitrate
+from gui_common import CompressorWindowMixin
+from job_io import OUTPUT_BUSY, IOScheduler, split_duplicate_outputs
+from job_journal import DONE, FAILED, RUNNING, JobJournal, finalize_output, prepare_partial_output
+from log_sink import LogSink
+from metadata_cache import default_cache_dir, get_metadata_cache
+from watch_folder import same_folder
+
 
 def get_version():
     return __version__
@@ -54,7 +77,150 @@ def apply_theme(app, force_dark=None):
         app.setStyleSheet("")
 
 
-class VideoCompressor(QMainWindow):
+class FFmpegProcessPool(QObject):
+    log_signal = pyqtSignal(str)
+    job_finished = pyqtSignal(int, int)  # row, exit code
+    finished_signal = pyqtSignal(bool)  # cancelled
+
+    def __init__(self, jobs, max_workers=None, parent=None, journal=None, io=None):
+        super().__init__(parent)
+        self.journal = journal
+        self.io = io or IOScheduler(jobs, on_log=self.log_signal.emit)
+        self.pending = deque(jobs)
+        self.max_workers = max(1, max_workers or default_job_count())
+        self.running = {}
+        self.buffers = {}
+        self.first_pass = {}
+        self.cancelled = False
+
+    def start(self):
+        self._fill()
+
+    def cancel(self):
+        self.cancelled = True
+        self.pending.clear()
+        for proc in list(self.running):
+            proc.kill()
+
+    def _fill(self):
+        while self.pending and len(self.running) < self.max_workers:
+            no_space = self.io.reserve_output(self.pending[0], wait=False)
+            if no_space == OUTPUT_BUSY:
+                # Started again when a running job finishes and releases its room.
+                break
+            job = self.pending.popleft()
+            if no_space:
+                self._fail_job(job, f"not enough disk space for the output, {no_space}")
+            else:
+                self._start_job(job)
+        if not self.pending and not self.running:
+            self.finished_signal.emit(self.cancelled)
+
+    def _start_job(self, job):
+        self.log_signal.emit(f"Compressing: {os.path.basename(job['input_file'])}")
+        if self.journal:
+            self.journal.set_state(job, RUNNING)
+        try:
+            prepare_partial_output(job['output_file'])
+        except OSError as e:
+            # Called from _fill in a slot: fail this job and let the pool carry on.
+            self._fail_job(job, e)
+            return
+        if job.get('pass1_cmd'):
+            self._launch(job, job['pass1_cmd'], first_pass=True)
+        else:
+            self._launch(job, job['cmd'])
+
+    def _launch(self, job, cmd, first_pass=False):
+        proc = QProcess(self)
+        proc.setProcessChannelMode(QProcess.MergedChannels)
+        proc.readyReadStandardOutput.connect(lambda: self._read_output(proc))
+        proc.finished.connect(lambda code, status: self._on_finished(proc, code, status))
+        proc.errorOccurred.connect(lambda error: self._on_error(proc, error))
+        self.running[proc] = job
+        self.buffers[proc] = ""
+        self.first_pass[proc] = first_pass
+        proc.start(cmd[0], cmd[1:])
+
+    def _fail_job(self, job, reason):
+        self._finish_job(job, False)
+        self.log_signal.emit(f"Error compressing {job['input_file']}: {reason}")
+        self.job_finished.emit(job['row'], -1)
+
+    def _finish_job(self, job, success):
+        self.io.release_output(job)
+        if job.get('passlog'):
+            remove_passlog(job['passlog'])
+        try:
+            finalize_output(job['output_file'], success)
+        except OSError as e:
+            self.log_signal.emit(f"[ERROR] Moving {job['output_file']} into place: {e}")
+            success = False
+        if self.journal:
+            self.journal.set_state(job, DONE if success else FAILED)
+        return success
+
+    def _read_output(self, proc):
+        job = self.running[proc]
+        text = self.buffers[proc] + bytes(proc.readAllStandardOutput()).decode(errors="replace")
+        # ffmpeg redraws its progress line with \r, treat it like a newline.
+        lines = text.replace("\r", "\n").split("\n")
+        self.buffers[proc] = lines.pop()
+        name = os.path.basename(job['input_file'])
+        for line in lines:
+            if line.strip():
+                self.log_signal.emit(f"[{name}] {line.strip()}")
+
+    def _on_finished(self, proc, exit_code, exit_status):
+        if proc not in self.running:
+            return
+        self._read_output(proc)
+        job = self.running.pop(proc)
+        self.buffers.pop(proc, None)
+        if self.first_pass.pop(proc) and exit_status == QProcess.NormalExit and exit_code == 0 and not self.cancelled:
+            self.log_signal.emit(f"First pass done: {os.path.basename(job['input_file'])}")
+            proc.deleteLater()
+            self._launch(job, job['cmd'])
+            return
+        if not self._finish_job(job, exit_status == QProcess.NormalExit and exit_code == 0):
+            exit_code = exit_code or -1
+        if exit_status == QProcess.NormalExit and exit_code == 0:
+            self.log_signal.emit(f"Finished: {os.path.basename(job['output_file'])}")
+        elif self.cancelled:
+            self.log_signal.emit(f"Cancelled: {os.path.basename(job['input_file'])}")
+        else:
+            self.log_signal.emit(f"Error compressing {job['input_file']}: ffmpeg exited with code {exit_code}")
+        self.job_finished.emit(job['row'], exit_code)
+        proc.deleteLater()
+        self._fill()
+
+    def _on_error(self, proc, error):
+        # A process that never started does not emit finished().
+        if error != QProcess.FailedToStart or proc not in self.running:
+            return
+        job = self.running.pop(proc)
+        self.buffers.pop(proc, None)
+        self.first_pass.pop(proc)
+        self._finish_job(job, False)
+        self.log_signal.emit(f"Error compressing {job['input_file']}: {proc.errorString()}")
+        self.job_finished.emit(job['row'], -1)
+        proc.deleteLater()
+        self._fill()
+
+
+FILE_COLUMNS = ['path', 'resolution', 'duration', 'size', 'est_size', 'est_time', 'ssim', 'codec', 'bit_rate', 'action']
+
+
+def estimate_row(job):
+    return estimate_ffmpeg_encode(
+        job['input_file'], job['metadata'], job['crf'], job['resolution'],
+        video_bit_rate=job['video_bit_rate'], scaler=job['scaler'],
+    )
+
+
+class VideoCompressor(CompressorWindowMixin, QMainWindow):
+    probe_metadata = staticmethod(get_video_metadata)
+
     def __init__(self):
         super().__init__()
         self.version = get_version()
@@ -64,23 +230,39 @@ class VideoCompressor(QMainWindow):
         self.setCentralWidget(self.central_widget)
 
         self.main_layout = QVBoxLayout(self.central_widget)
+        self.pool = None
+        self.probe_workers = []
+        self.estimate_workers = []
+        self.watch_worker = None
+        self.watch_queue = []
         self.init_ui()
+        self.journal = JobJournal("ffmpeg", on_log=self.log.append)
+        watch_folder = self.settings.value("watch_folder", "")
+        if self.settings.value("watch_enabled", "false") == "true" and os.path.isdir(watch_folder) \
+                and os.path.isdir(self.output_path.text()) and not same_folder(watch_folder, self.output_path.text()):
+            self.start_watching(watch_folder)
 
     def init_ui(self):
         self._create_menu()
 
-        self.table = QTableWidget(0, 4)
-        self.table.setHorizontalHeaderLabels(["File Path", "Resolution", "Duration", "Size"])
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.files = FileTableModel(FILE_COLUMNS, self)
+        self.table, self.table_proxy = create_file_view(self.files, self)
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter files...")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.textChanged.connect(self.table_proxy.set_filter_text)
 
         self.add_files_button = QPushButton("Add Videos")
         self.clear_files_button = QPushButton("Clear List")
+        self.estimate_button = QPushButton("Estimate Output")
         self.add_files_button.clicked.connect(self.add_files)
         self.clear_files_button.clicked.connect(self.clear_table)
+        self.estimate_button.clicked.connect(self.estimate_all)
 
         file_button_layout = QHBoxLayout()
         file_button_layout.addWidget(self.add_files_button)
         file_button_layout.addWidget(self.clear_files_button)
+        file_button_layout.addWidget(self.estimate_button)
 
         self.output_path = QLineEdit()
         self.output_path.setText(self.settings.value("output_path", ""))
@@ -92,39 +274,71 @@ class VideoCompressor(QMainWindow):
         output_layout.addWidget(self.browse_output)
 
         self.crf_combo = QComboBox()
-        self.crf_combo.addItems([
-            "High Quality (Large)",
-            "Medium Quality",
-            "Low Quality (Small)",
-            "Very Low (Tiny file)"
-        ])
-        self.crf_map = {
-            "High Quality (Large)": 18,
-            "Medium Quality": 23,
-            "Low Quality (Small)": 28,
-            "Very Low (Tiny file)": 32,
-        }
+        self.crf_combo.addItems(list(analysis.QUALITY_CRF))
+        self.crf_map = analysis.QUALITY_CRF
 
         self.res_combo = QComboBox()
-        self.res_combo.addItems(["Original", "1080p", "720p", "480p"])
+        self.res_combo.addItems(["Original"] + list(analysis.SCALE_MAP))
+        self.scale_map = analysis.SCALE_MAP
+
+        self.scaler_combo = QComboBox()
+        self.scaler_combo.addItems(list(analysis.SCALERS))
+        self.scaler_combo.setCurrentText(self.settings.value("scaler", "Bicubic"))
+        self.scaler_combo.setToolTip("Interpolation used when downscaling")
+
+        self.rate_combo = QComboBox()
+        self.rate_combo.addItems(analysis.RATE_MODES)
+        self.rate_combo.setCurrentText(self.settings.value("rate_mode", analysis.RATE_QUALITY))
+        self.target_spin = QSpinBox()
+        self.target_spin.setRange(1, 1000000)
+        self.target_spin.setValue(int(self.settings.value("rate_target", 25)))
+        self.rate_combo.currentTextChanged.connect(self.update_rate_mode)
+        self.update_rate_mode()
+
+        self.smart_check = QCheckBox("Skip/Remux When Encoding Won't Help")
+        self.smart_check.setChecked(self.settings.value("smart_skip", "true") == "true")
+        self.crf_combo.currentTextChanged.connect(self.refresh_actions)
+        self.res_combo.currentTextChanged.connect(self.refresh_actions)
+        self.scaler_combo.currentTextChanged.connect(self.clear_estimates)
+        self.target_spin.valueChanged.connect(self.refresh_actions)
+        self.smart_check.toggled.connect(self.refresh_actions)
+
+        self.jobs_spin = QSpinBox()
+        self.jobs_spin.setRange(1, max(os.cpu_count() or 1, 16))
+        self.jobs_spin.setValue(int(self.settings.value("max_jobs", default_job_count())))
 
         settings_layout = QHBoxLayout()
-        settings_layout.addWidget(QLabel("Compression Quality:"))
+        settings_layout.addWidget(self.rate_combo)
         settings_layout.addWidget(self.crf_combo)
+        settings_layout.addWidget(self.target_spin)
         settings_layout.addWidget(QLabel("Resolution:"))
         settings_layout.addWidget(self.res_combo)
+        settings_layout.addWidget(QLabel("Scaling:"))
+        settings_layout.addWidget(self.scaler_combo)
+        settings_layout.addWidget(QLabel("Parallel Jobs:"))
+        settings_layout.addWidget(self.jobs_spin)
+        settings_layout.addWidget(self.smart_check)
 
         self.log_box = QTextEdit()
         self.log_box.setReadOnly(True)
+        self.log = LogSink(self.log_box, log_file=self.log_file_path() if self.log_to_file() else None, parent=self)
 
         self.start_btn = QPushButton("Compress All Videos")
-        self.start_btn.clicked.connect(self.compress_all)
+        self.start_btn.clicked.connect(lambda: self.compress_all())
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_compression)
+
+        run_layout = QHBoxLayout()
+        run_layout.addWidget(self.start_btn)
+        run_layout.addWidget(self.cancel_btn)
 
         self.main_layout.addLayout(file_button_layout)
+        self.main_layout.addWidget(self.filter_edit)
         self.main_layout.addWidget(self.table)
         self.main_layout.addLayout(output_layout)
         self.main_layout.addLayout(settings_layout)
-        self.main_layout.addWidget(self.start_btn)
+        self.main_layout.addLayout(run_layout)
         self.main_layout.addWidget(QLabel("Log:"))
         self.main_layout.addWidget(self.log_box)
 
@@ -142,11 +356,41 @@ class VideoCompressor(QMainWindow):
         theme_action.triggered.connect(self.toggle_theme)
         settings_menu.addAction(theme_action)
 
+        log_file_action = QAction("Save Log to File", self)
+        log_file_action.setCheckable(True)
+        log_file_action.setChecked(self.log_to_file())
+        log_file_action.toggled.connect(self.toggle_log_file)
+        settings_menu.addAction(log_file_action)
+
+        reencode_action = QAction("Re-encode Already Compressed Files", self)
+        reencode_action.setCheckable(True)
+        reencode_action.setChecked(self.settings.value("reencode_done", "false") == "true")
+        reencode_action.toggled.connect(
+            lambda enabled: self.settings.setValue("reencode_done", "true" if enabled else "false"))
+        settings_menu.addAction(reencode_action)
+
+        self.watch_action = QAction("Watch Folder...", self)
+        self.watch_action.setCheckable(True)
+        self.watch_action.triggered.connect(self.toggle_watch)
+        settings_menu.addAction(self.watch_action)
+
         help_menu = menubar.addMenu("Help")
         about_action = QAction("About", self)
         about_action.triggered.connect(self.show_about)
         help_menu.addAction(about_action)
 
+    def log_to_file(self):
+        return self.settings.value("log_to_file", "false") == "true"
+
+    def log_file_path(self):
+        return os.path.join(default_cache_dir(), "logs", "ffmpeg.log")
+
+    def toggle_log_file(self, enabled):
+        self.settings.setValue("log_to_file", "true" if enabled else "false")
+        self.log.set_log_file(self.log_file_path() if enabled else None)
+        if enabled:
+            self.log.append(f"Mirroring log to {self.log_file_path()}")
+
     def toggle_theme(self):
         current = self.settings.value("theme")
         force_dark = current != "dark"
@@ -162,59 +406,72 @@ class VideoCompressor(QMainWindow):
             "All rights reserved.",
         )
 
-    def add_files(self):
-        files, _ = QFileDialog.getOpenFileNames(
-            self, "Select Video Files", "", "Videos (*.mp4 *.avi *.mov *.mkv)"
+    def on_probe_error(self, row, file, message, generation):
+        if not self.files.has_row(row, file, generation):
+            return
+        if not self.files.record(row).probe_failed:
+            # compress_all may have hit the same error first.
+            self.log.append(f"[ERROR] ffprobe failed: {message}")
+        self.files.record(row).probe_failed = True
+        self.update_action(row)
+
+    def update_rate_mode(self):
+        mode = self.rate_combo.currentText()
+        self.crf_combo.setVisible(mode == analysis.RATE_QUALITY)
+        self.target_spin.setVisible(mode != analysis.RATE_QUALITY)
+        self.target_spin.setSuffix(" MB" if mode == analysis.RATE_TARGET_SIZE else " kb/s")
+        self.refresh_actions()
+
+    def analyze_row(self, row):
+        record = self.files.record(row)
+        if not self.smart_check.isChecked():
+            return analysis.ENCODE, "smart skip disabled"
+        # The ffmpeg window keeps the source container, so it never needs a
+        # remux: a file either gets skipped or re-encoded.
+        ext = os.path.splitext(record.path)[1].lstrip(".")
+        crf = self.crf_map[self.crf_combo.currentText()]
+        return analysis.analyze_file(
+            record.metadata, record.path, ext, crf, self.scale_map.get(self.res_combo.currentText()),
+            self.target_bit_rate(record.metadata),
         )
-        for file in files:
-            res, dur = self.get_video_metadata(file)
-            size = f"{os.path.getsize(file) / (1024 * 1024):.1f} MB"
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.table.setItem(row, 0, QTableWidgetItem(file))
-            self.table.setItem(row, 1, QTableWidgetItem(res))
-            self.table.setItem(row, 2, QTableWidgetItem(dur))
-            self.table.setItem(row, 3, QTableWidgetItem(size))
-
-    def clear_table(self):
-        self.table.setRowCount(0)
+
+    def update_action(self, row):
+        action, reason = self.analyze_row(row)
+        # Repaints the whole row, which also picks up new probe results.
+        self.files.update(row, action=action, reason=reason)
+
+    def video_bit_rate(self, metadata):
+        total_bit_rate = self.target_bit_rate(metadata)
+        if not total_bit_rate:
+            return None
+        audio_bit_rate = FFMPEG_AUDIO_BIT_RATE if metadata.get('audio_streams') else 0
+        return analysis.video_bit_rate_for_target(total_bit_rate, audio_bit_rate)
+
+    def estimate_all(self):
+        self.cancel_estimates()
+        crf = self.crf_map[self.crf_combo.currentText()]
+        resolution = self.scale_map.get(self.res_combo.currentText())
+        jobs = []
+        for row, record in enumerate(self.files.records):
+            if record.metadata is None or self.analyze_row(row)[0] == analysis.SKIP:
+                continue
+            jobs.append(dict(
+                row=row, input_file=record.path, metadata=record.metadata, crf=crf, resolution=resolution,
+                video_bit_rate=self.video_bit_rate(record.metadata),
+                scaler=analysis.SCALERS[self.scaler_combo.currentText()],
+            ))
+        self.start_estimates(jobs, estimate_row)
+
+    @property
+    def batch_running(self):
+        return self.pool is not None
 
     def select_output_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Output Folder")
         if folder:
             self.output_path.setText(folder)
 
-    def get_video_metadata(self, filepath):
-        if getattr(sys, "frozen", False):
-            base_path = sys._MEIPASS
-        else:
-            base_path = os.path.dirname(__file__)
-        ffprobe = os.path.join(base_path, "ffprobe.exe")
-
-        filepath = os.path.abspath(filepath)
-        try:
-            res_proc = subprocess.run(
-                [ffprobe, "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height",
-                 "-of", "csv=s=x:p=0", filepath],
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True
-            )
-            dur_proc = subprocess.run(
-                [ffprobe, "-v", "error", "-show_entries", "format=duration",
-                 "-of", "default=noprint_wrappers=1:nokey=1", filepath],
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True
-            )
-            resolution = res_proc.stdout.strip() or "?"
-            try:
-                duration_sec = float(dur_proc.stdout.strip())
-                duration = f"{int(duration_sec // 60):02}:{int(duration_sec % 60):02}"
-            except ValueError:
-                duration = "?"
-            return resolution, duration
-        except Exception as e:
-            self.log_box.append(f"[ERROR] ffprobe failed: {str(e)}")
-            return "?", "?"
-
-    def compress_all(self):
+    def compress_all(self, rows=None):
         crf = self.crf_map[self.crf_combo.currentText()]
         resolution = self.res_combo.currentText()
         output = self.output_path.text()
@@ -222,64 +479,126 @@ class VideoCompressor(QMainWindow):
         self.settings.setValue("output_path", output)
         self.settings.setValue("crf_label", self.crf_combo.currentText())
         self.settings.setValue("resolution", resolution)
+        self.settings.setValue("scaler", self.scaler_combo.currentText())
+        self.settings.setValue("smart_skip", "true" if self.smart_check.isChecked() else "false")
+        self.settings.setValue("rate_mode", self.rate_combo.currentText())
+        self.settings.setValue("rate_target", self.target_spin.value())
+        two_pass = self.rate_combo.currentText() != analysis.RATE_QUALITY
 
         if not os.path.isdir(output):
             QMessageBox.critical(self, "Error", "Please select a valid output folder.")
             return
 
-        if getattr(sys, "frozen", False):
-            base_path = sys._MEIPASS
-        else:
-            base_path = os.path.dirname(__file__)
-        ffmpeg = os.path.join(base_path, "ffmpeg.exe")
-        scale_map = {
-            "1080p": "1920:1080",
-            "720p": "1280:720",
-            "480p": "854:480",
-        }
-
-        self.log_box.clear()
-        self.log_box.append("Starting batch compression...")
-
-        for row in range(self.table.rowCount()):
-            input_file = self.table.item(row, 0).text()
+        if rows is None:
+            self.log.clear()
+        self.log.append("Starting batch compression...")
+
+        jobs = []
+        for row in range(len(self.files.records)) if rows is None else rows:
+            record = self.files.record(row)
+            input_file = record.path
             name, ext = os.path.splitext(os.path.basename(input_file))
             output_file = os.path.join(output, f"{name}_compressed{ext}")
-            cmd = [
-                ffmpeg,
-                "-i", input_file,
-                "-vcodec", "libx264",
-                "-crf", str(crf),
-                "-preset", "fast",
-                "-acodec", "aac"
-            ]
-            if resolution != "Original":
-                cmd += ["-vf", f"scale={scale_map[resolution]}"]
-            cmd.append(output_file)
-
-            self.log_box.append(f"Compressing: {os.path.basename(input_file)}")
-            try:
-                proc = subprocess.Popen(
-                    cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True
-                )
-                for line in proc.stdout:
-                    self.log_box.append(line.strip())
-                proc.wait()
-                self.log_box.append(f"Finished: {os.path.basename(output_file)}")
-            except Exception as e:
-                self.log_box.append(f"Error compressing {input_file}: {e}")
-
-        QMessageBox.information(self, "Done", "All videos have been compressed.")
+            if record.metadata is None and not record.probe_failed:
+                # Still queued in a ProbeWorker, e.g. files that just arrived in a watched folder.
+                try:
+                    record.metadata = get_metadata_cache().get_or_probe(input_file, get_video_metadata)
+                except Exception as e:
+                    self.log.append(f"[ERROR] ffprobe failed: {e}")
+                    record.probe_failed = True
+            action, reason = self.analyze_row(row)
+            self.update_action(row)
+            if action == analysis.SKIP:
+                self.log.append(f"Skipped: {os.path.basename(input_file)} ({reason})")
+                self.mark_watched_done(input_file)
+                continue
+            metadata = record.metadata or {}
+            video_bit_rate = None
+            if two_pass:
+                video_bit_rate = self.video_bit_rate(metadata)
+                if video_bit_rate:
+                    self.log.append(f"Two-pass at {format_bitrate(video_bit_rate)} video: {os.path.basename(input_file)}")
+                else:
+                    self.log.append(f"[WARNING] Unknown duration, using CRF {crf} for {os.path.basename(input_file)}")
+            job = build_ffmpeg_job(
+                row, input_file, output_file, metadata, crf, self.scale_map.get(resolution),
+                video_bit_rate=video_bit_rate, scaler=analysis.SCALERS[self.scaler_combo.currentText()],
+            )
+            estimate = self.files.record(row).estimate
+            if isinstance(estimate, dict):
+                # Estimates are cleared whenever a setting changes, so this one matches the job.
+                job['estimated_size'] = estimate['size']
+            jobs.append(job)
+
+        self.settings.setValue("max_jobs", self.jobs_spin.value())
+        jobs, duplicates = split_duplicate_outputs(jobs)
+        for job, first in duplicates:
+            # Outputs are named after the file name alone, so clips from two folders can collide.
+            self.log.append(f"[ERROR] {job['input_file']} would overwrite the output of {first['input_file']}. Skipping.")
+
+        if self.settings.value("reencode_done", "false") == "true":
+            # Like the CLI's --no-resume: outputs from earlier batches are written again.
+            pending = jobs
+        else:
+            pending = self.journal.filter_pending(jobs, get_video_metadata, self.log.append)
+        pending_rows = {job['row'] for job in pending}
+        for job in jobs:
+            if job['row'] not in pending_rows:
+                self.mark_watched_done(job['input_file'])
+        # Files finished by an earlier batch count as compressed, as in the CLI.
+        self.batch_total, self.batch_failed = len(jobs), 0
+        jobs = pending
+        self.journal.start_batch(jobs)
+        inputs = {job['row']: job['input_file'] for job in jobs}
+
+        def on_job_finished(row, exit_code):
+            if exit_code == 0:
+                self.mark_watched_done(inputs[row])
+            else:
+                self.batch_failed += 1
+
+        self.pool = FFmpegProcessPool(jobs, self.jobs_spin.value(), self, self.journal)
+        self.pool.log_signal.connect(self.log.append)
+        self.pool.job_finished.connect(on_job_finished)
+        self.pool.finished_signal.connect(self.on_batch_finished)
+        self.start_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.pool.start()
+
+    def cancel_compression(self):
+        if self.pool:
+            self.log.append("Cancelling batch...")
+            self.pool.cancel()
+
+    def on_batch_finished(self, cancelled):
+        self.start_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        self.pool.deleteLater()
+        self.pool = None
+        summary = f"Done: {self.batch_total - self.batch_failed} of {self.batch_total} file(s) compressed."
+        if cancelled:
+            # A cancelled batch was stopped on purpose, don't offer to resume it.
+            self.journal.discard_unfinished()
+        else:
+            self.log.append(summary)
+        self.log.flush()
+        if self.watch_worker:
+            # Unattended: no dialog, just pick up whatever arrived meanwhile.
+            self.log.append("Batch finished, waiting for new files")
+            self.start_watch_batch()
+        elif cancelled:
+            QMessageBox.information(self, "Cancelled", "Batch compression was cancelled.")
+        elif self.batch_failed:
+            QMessageBox.warning(self, "Done", f"{summary}\n{self.batch_failed} file(s) failed, see the log for details.")
+        else:
+            QMessageBox.information(self, "Done", summary)
 
 
 if __name__ == "__main__":
-    if "--version" in sys.argv:
-        print(f"Video Compressor v{get_version()}")
-        sys.exit(0)
-
     app = QApplication(sys.argv)
     apply_theme(app)
     win = VideoCompressor()
     win.resize(850, 600)
     win.show()
+    win.offer_resume()
     sys.exit(app.exec_())
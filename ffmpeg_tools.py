@@ -0,0 +1,324 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import analysis
+from job_io import IOScheduler
+from job_journal import DONE, FAILED, RUNNING, finalize_output, partial_output_path, prepare_partial_output
+
+# Two-pass encodes set the AAC bitrate explicitly so the video bitrate for a
+# target size can be worked out in advance.
+FFMPEG_AUDIO_BIT_RATE = 128000
+
+
+def default_job_count():
+    # Each ffmpeg process already runs libx264 with its own thread pool, so
+    # only use half the cores' worth of processes by default.
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+def get_binary_path(name):
+    if getattr(sys, "frozen", False):
+        base_path = sys._MEIPASS
+    else:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(base_path, name)
+    if os.path.exists(path):
+        return path
+    # No bundled binary (e.g. a Linux render node): use the one on PATH.
+    return shutil.which(os.path.splitext(name)[0]) or path
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_rate(value):
+    try:
+        num, den = (value or "").split("/")
+        return float(num) / float(den) if float(den) else None
+    except ValueError:
+        return None
+
+
+def get_video_metadata(filepath):
+    """Probe a file with a single ffprobe call and return a metadata dict."""
+    proc = subprocess.run(
+        [get_binary_path("ffprobe.exe"), "-v", "error", "-print_format", "json",
+         "-show_format", "-show_streams", os.path.abspath(filepath)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True
+    )
+    info = json.loads(proc.stdout or "{}")
+    streams = info.get("streams", [])
+    fmt = info.get("format", {})
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise ValueError("no video stream")
+
+    duration = _parse_float(fmt.get("duration")) or _parse_float(video.get("duration"))
+    fps = _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate"))
+    frames = _parse_int(video.get("nb_frames"))
+    if not frames and duration and fps:
+        frames = int(duration * fps)
+    return {
+        'width': _parse_int(video.get("width")),
+        'height': _parse_int(video.get("height")),
+        'duration': duration,
+        'video_codec': video.get("codec_name"),
+        'pix_fmt': video.get("pix_fmt"),
+        'fps': fps,
+        'frames': frames,
+        'video_bit_rate': _parse_int(video.get("bit_rate")),
+        'bit_rate': _parse_int(fmt.get("bit_rate")),
+        'audio_streams': [
+            {
+                'codec': s.get("codec_name"),
+                'channels': _parse_int(s.get("channels")),
+                'sample_rate': _parse_int(s.get("sample_rate")),
+                'bit_rate': _parse_int(s.get("bit_rate")),
+            }
+            for s in streams if s.get("codec_type") == "audio"
+        ],
+    }
+
+
+def scale_filter(resolution, scaler=analysis.DEFAULT_SCALER):
+    """``-vf`` chain that fits the video in the ``resolution`` box like ``analysis.fit_resolution``.
+
+    Scaling and the conversion to yuv420p run in the same libswscale pass.
+    """
+    width, height = resolution
+    return (f"scale='min(iw,{width})':'min(ih,{height})':force_original_aspect_ratio=decrease:"
+            f"force_divisible_by=2:flags={scaler},format=yuv420p")
+
+
+def build_ffmpeg_command(input_file, output_file, crf, resolution=None, preset="fast", scaler=analysis.DEFAULT_SCALER):
+    cmd = [
+        get_binary_path("ffmpeg.exe"),
+        "-nostdin",
+        "-i", input_file,
+        "-vcodec", "libx264",
+        "-crf", str(crf),
+        "-preset", preset,
+        "-acodec", "aac"
+    ]
+    if resolution:
+        cmd += ["-vf", scale_filter(resolution, scaler)]
+    cmd.append(output_file)
+    return cmd
+
+
+def passlog_path(output_file):
+    # Named after the output so a rerun of the same job builds the same
+    # command line, which the job journal keys on.
+    digest = hashlib.sha1(os.path.abspath(output_file).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"video_compressor_2pass_{digest}")
+
+
+def remove_passlog(passlog):
+    for path in glob.glob(glob.escape(passlog) + "*"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def build_ffmpeg_two_pass_commands(input_file, output_file, video_bit_rate, passlog, resolution=None, preset="fast",
+                                   scaler=analysis.DEFAULT_SCALER):
+    """Return the (first pass, second pass) commands for a bitrate-targeted encode.
+
+    The first pass skips audio and throws its output away; libx264 also
+    runs it with fast analysis settings, so it costs well under a full encode.
+    """
+    ffmpeg = get_binary_path("ffmpeg.exe")
+    video = ["-vcodec", "libx264", "-b:v", str(video_bit_rate), "-preset", preset, "-passlogfile", passlog]
+    if resolution:
+        video += ["-vf", scale_filter(resolution, scaler)]
+    first_pass = [ffmpeg, "-nostdin", "-y", "-i", input_file] + video + ["-pass", "1", "-an", "-f", "null", "-"]
+    second_pass = [ffmpeg, "-nostdin", "-i", input_file] + video + [
+        "-pass", "2", "-acodec", "aac", "-b:a", str(FFMPEG_AUDIO_BIT_RATE), output_file
+    ]
+    return first_pass, second_pass
+
+
+def estimate_ffmpeg_encode(input_file, metadata, crf, resolution=None, preset="fast", video_bit_rate=None,
+                           scaler=analysis.DEFAULT_SCALER, samples=analysis.ESTIMATE_SAMPLES,
+                           sample_seconds=analysis.ESTIMATE_SAMPLE_SECONDS):
+    """Encode a few short slices with ffmpeg and project the full encode.
+
+    Returns ``{'size', 'seconds', 'ssim'}`` like ``engine.estimate_job``;
+    the SSIM comes from ffmpeg's ssim filter against the source scaled to
+    the output size.
+    """
+    if not metadata.get('duration'):
+        raise ValueError("unknown duration")
+    ffmpeg = get_binary_path("ffmpeg.exe")
+    rate = ["-b:v", str(video_bit_rate)] if video_bit_rate else ["-crf", str(crf)]
+    video_filter = scale_filter(resolution, scaler) if resolution else "format=yuv420p"
+    sampled_seconds = video_bytes = encode_seconds = 0
+    ssim_scores = []
+    with tempfile.TemporaryDirectory(prefix="video_compressor_estimate_") as tmp:
+        for i, (start, length) in enumerate(analysis.sample_windows(metadata['duration'], samples, sample_seconds)):
+            sample = os.path.join(tmp, f"{i}.mkv")
+            window = ["-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", input_file]
+            started = time.perf_counter()
+            encode = [ffmpeg, "-nostdin", "-y", *window, "-map", "0:v:0", "-vcodec", "libx264", *rate,
+                      "-preset", preset, "-vf", video_filter, "-an", sample]
+            subprocess.run(
+                encode, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+            )
+            encode_seconds += time.perf_counter() - started
+            sampled_seconds += length
+            video_bytes += os.path.getsize(sample)
+            compare = [ffmpeg, "-nostdin", "-i", sample, *window,
+                       "-lavfi", f"[1:v]{video_filter}[ref];[0:v][ref]ssim", "-f", "null", "-"]
+            proc = subprocess.run(
+                compare, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True,
+            )
+            match = re.search(r"SSIM .*All:([\d.]+)", proc.stderr)
+            if match:
+                ssim_scores.append(float(match.group(1)))
+    audio_bit_rate = FFMPEG_AUDIO_BIT_RATE if metadata.get('audio_streams') else 0
+    return analysis.project_estimate(
+        metadata['duration'], sampled_seconds, video_bytes, encode_seconds,
+        sum(ssim_scores) / len(ssim_scores) if ssim_scores else None, audio_bit_rate,
+    )
+
+
+def build_ffmpeg_remux_command(input_file, output_file):
+    return [get_binary_path("ffmpeg.exe"), "-nostdin", "-i", input_file, "-map", "0", "-c", "copy", output_file]
+
+
+def build_ffmpeg_job(row, input_file, output_file, metadata, crf, resolution=None, preset="fast", remux=False,
+                     video_bit_rate=None, scaler=analysis.DEFAULT_SCALER):
+    """Build a job for ``run_ffmpeg_jobs``/``FFmpegProcessPool``.
+
+    With ``video_bit_rate`` the job is a two-pass encode at that bitrate
+    instead of a CRF encode.
+    """
+    partial_file = partial_output_path(output_file)
+    job = {
+        'row': row,
+        'input_file': input_file,
+        'output_file': output_file,
+        'duration': (metadata or {}).get('duration'),
+    }
+    if remux:
+        job['cmd'] = build_ffmpeg_remux_command(input_file, partial_file)
+    elif video_bit_rate:
+        # Lets IOScheduler work out how much room the output needs.
+        job['video_bit_rate'] = video_bit_rate
+        job['audio_bit_rate'] = FFMPEG_AUDIO_BIT_RATE if (metadata or {}).get('audio_streams') else 0
+        job['passlog'] = passlog_path(output_file)
+        job['pass1_cmd'], job['cmd'] = build_ffmpeg_two_pass_commands(
+            input_file, partial_file, video_bit_rate, job['passlog'], resolution, preset, scaler
+        )
+    else:
+        job['cmd'] = build_ffmpeg_command(input_file, partial_file, crf, resolution, preset, scaler)
+    return job
+
+
+def run_ffmpeg_jobs(jobs, max_workers=None, on_log=print, on_job_finished=None, journal=None, io=None):
+    """Run ffmpeg jobs (dicts with ``input_file``, ``output_file`` and ``cmd``)
+    on a bounded pool of subprocesses without Qt.
+
+    ``cmd`` must write to ``partial_output_path(output_file)``; the partial
+    file is renamed to ``output_file`` once ffmpeg exits cleanly. Two-pass
+    jobs also carry ``pass1_cmd`` and ``passlog``. Output
+    lines are passed to ``on_log`` prefixed with the input name, and
+    ``on_job_finished(job, returncode)`` is called as each job ends. Job
+    states are recorded in ``journal`` when given. Before a job starts,
+    ``io`` (an ``IOScheduler``) must find room for its output, as in
+    ``engine.BatchCompressor``. Returns the jobs that failed.
+    """
+    log_lock = threading.Lock()
+
+    def log(line):
+        with log_lock:
+            on_log(line)
+
+    io = io or IOScheduler(jobs, on_log=log)
+
+    def run_command(job, cmd):
+        name = os.path.basename(job['input_file'])
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        except OSError as e:
+            log(f"Error compressing {job['input_file']}: {e}")
+            return -1
+        for line in proc.stdout:
+            if line.strip():
+                log(f"[{name}] {line.strip()}")
+        return proc.wait()
+
+    def run_job(job):
+        no_space = io.reserve_output(job)
+        if no_space:
+            log(f"Error compressing {job['input_file']}: not enough disk space for the output, {no_space}")
+            if journal:
+                journal.set_state(job, FAILED)
+            return job, -1
+        try:
+            return run_reserved_job(job)
+        finally:
+            io.release_output(job)
+
+    def run_reserved_job(job):
+        log(f"Compressing: {os.path.basename(job['input_file'])}")
+        if journal:
+            journal.set_state(job, RUNNING)
+        try:
+            prepare_partial_output(job['output_file'])
+        except OSError as e:
+            log(f"Error compressing {job['input_file']}: {e}")
+            if journal:
+                journal.set_state(job, FAILED)
+            return job, -1
+        returncode = 0
+        if job.get('pass1_cmd'):
+            returncode = run_command(job, job['pass1_cmd'])
+        if returncode == 0:
+            returncode = run_command(job, job['cmd'])
+        if job.get('passlog'):
+            remove_passlog(job['passlog'])
+        try:
+            finalize_output(job['output_file'], returncode == 0)
+        except OSError as e:
+            log(f"Error moving {job['output_file']} into place: {e}")
+            returncode = -1
+        if journal:
+            journal.set_state(job, DONE if returncode == 0 else FAILED)
+        if returncode == 0:
+            log(f"Finished: {os.path.basename(job['output_file'])}")
+        else:
+            log(f"Error compressing {job['input_file']}: ffmpeg exited with code {returncode}")
+        return job, returncode
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers or default_job_count())) as pool:
+        for future in as_completed([pool.submit(run_job, job) for job in jobs]):
+            job, returncode = future.result()
+            if returncode != 0:
+                failed.append(job)
+            if on_job_finished:
+                on_job_finished(job, returncode)
+    return failed
@@ -0,0 +1,323 @@
+import os
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QSize, QSortFilterProxyModel, Qt
+from PyQt5.QtGui import QPixmap, QPixmapCache
+from PyQt5.QtWidgets import (
+    QAbstractItemView, QApplication, QHeaderView, QStyle, QStyledItemDelegate, QStyleOptionProgressBar, QTableView
+)
+
+import analysis
+from formatting import format_bitrate, format_duration
+
+SORT_ROLE = Qt.UserRole + 1
+PROGRESS_ROLE = Qt.UserRole + 2
+
+COLUMN_TITLES = {
+    'path': "File Path",
+    'resolution': "Resolution",
+    'duration': "Duration",
+    'size': "Size",
+    'est_size': "Est. Size",
+    'est_time': "Est. Time",
+    'ssim': "SSIM",
+    'codec': "Codec",
+    'bit_rate': "Bitrate",
+    'action': "Action",
+    'progress': "Progress",
+    'preview': "Preview",
+}
+
+# Rows handed to the view per fetchMore(), so a huge batch is only laid out
+# as far as the user scrolls.
+FETCH_BATCH = 500
+
+PENDING = "…"
+
+# Thumbnail strips are read from disk as rows are painted; keep the
+# recently shown ones decoded rather than holding one per row.
+PREVIEW_CACHE_KB = 32 * 1024
+
+
+class FileRecord:
+    """One file in the batch table. Plain attributes, no per-cell objects."""
+
+    __slots__ = ("path", "size", "metadata", "probe_failed", "estimate", "action", "reason", "progress",
+                 "progress_text", "thumbnail")
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.metadata = None
+        self.probe_failed = False
+        self.estimate = None  # None, PENDING, an estimate dict, or an error string
+        self.action = None
+        self.reason = ""
+        self.progress = 0
+        self.progress_text = ""
+        self.thumbnail = None  # path of the cached strip image
+
+
+def _metadata_text(record, text):
+    if record.metadata is None:
+        return "?" if record.probe_failed else PENDING
+    return text(record.metadata)
+
+
+def _estimate_text(record, text):
+    if record.estimate is None:
+        return ""
+    if record.estimate == PENDING:
+        return PENDING
+    if isinstance(record.estimate, str):
+        return "?"
+    return text(record.estimate)
+
+
+def _resolution(metadata):
+    return f"{metadata['width']}x{metadata['height']}" if metadata.get('width') else "?"
+
+
+def _ssim(estimate):
+    return f"{estimate['ssim']:.3f}" if estimate['ssim'] is not None else "?"
+
+
+DISPLAY = {
+    'path': lambda r: r.path,
+    'resolution': lambda r: _metadata_text(r, _resolution),
+    'duration': lambda r: _metadata_text(r, lambda m: format_duration(m.get('duration'))),
+    'size': lambda r: f"{r.size / (1024 * 1024):.1f} MB",
+    'est_size': lambda r: _estimate_text(r, lambda e: f"{e['size'] / (1024 * 1024):.1f} MB"),
+    'est_time': lambda r: _estimate_text(r, lambda e: format_duration(e['seconds'])),
+    'ssim': lambda r: _estimate_text(r, _ssim),
+    'codec': lambda r: _metadata_text(r, lambda m: m.get('video_codec') or "?"),
+    'bit_rate': lambda r: _metadata_text(r, lambda m: format_bitrate(m.get('bit_rate'))),
+    'action': lambda r: analysis.ACTION_LABELS[r.action] if r.action else (
+        "?" if r.probe_failed else PENDING),
+    'progress': lambda r: r.progress_text,
+    'preview': lambda r: "",
+}
+
+
+def _estimate_value(record, key):
+    return record.estimate[key] or 0 if isinstance(record.estimate, dict) else -1
+
+
+SORT_KEY = {
+    'path': lambda r: r.path.lower(),
+    'resolution': lambda r: ((r.metadata or {}).get('width') or 0) * ((r.metadata or {}).get('height') or 0),
+    'duration': lambda r: (r.metadata or {}).get('duration') or 0,
+    'size': lambda r: r.size,
+    'est_size': lambda r: _estimate_value(r, 'size'),
+    'est_time': lambda r: _estimate_value(r, 'seconds'),
+    'ssim': lambda r: _estimate_value(r, 'ssim'),
+    'codec': lambda r: (r.metadata or {}).get('video_codec') or "",
+    'bit_rate': lambda r: (r.metadata or {}).get('bit_rate') or 0,
+    'action': lambda r: r.action or "",
+    'progress': lambda r: r.progress,
+    'preview': lambda r: r.path.lower(),
+}
+
+ESTIMATE_COLUMNS = ('est_size', 'est_time', 'ssim')
+
+
+def _preview_pixmap(path):
+    pixmap = QPixmapCache.find(path)
+    if pixmap is None:
+        pixmap = QPixmap(path)
+        QPixmapCache.insert(path, pixmap)
+    return pixmap
+
+
+class FileTableModel(QAbstractTableModel):
+    """The batch file list as a table model over ``FileRecord``s.
+
+    Rows are always addressed by their position in the model, which is
+    what jobs carry as ``row``; sorting and filtering happen in a
+    ``FileFilterProxy`` on top, so a row number stays valid until the list
+    is cleared. Records are handed to the view ``FETCH_BATCH`` at a time
+    through ``canFetchMore``/``fetchMore``.
+    """
+
+    def __init__(self, columns, parent=None):
+        super().__init__(parent)
+        self.columns = list(columns)
+        self.records = []
+        self.loaded = 0
+        # Bumped by clear(), so results for rows of an earlier list can be told apart.
+        self.generation = 0
+
+    def column(self, key):
+        return self.columns.index(key)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.records)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(FETCH_BATCH, len(self.records) - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def fetch_all(self):
+        if self.loaded < len(self.records):
+            self.beginInsertRows(QModelIndex(), self.loaded, len(self.records) - 1)
+            self.loaded = len(self.records)
+            self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMN_TITLES[self.columns[section]]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.records[index.row()]
+        key = self.columns[index.column()]
+        if role == Qt.DisplayRole:
+            return DISPLAY[key](record)
+        if role == SORT_ROLE:
+            return SORT_KEY[key](record)
+        if role == PROGRESS_ROLE:
+            return record.progress
+        if role == Qt.DecorationRole and key == 'preview' and record.thumbnail:
+            return _preview_pixmap(record.thumbnail)
+        if role == Qt.ToolTipRole:
+            if key == 'path':
+                return record.path
+            if key == 'action':
+                return record.reason
+            if key in ESTIMATE_COLUMNS and isinstance(record.estimate, str) and record.estimate != PENDING:
+                return record.estimate
+        return None
+
+    def add_files(self, paths):
+        """Append records for ``paths`` and return their ``(row, path)`` pairs."""
+        added = []
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            added.append((len(self.records), path))
+            self.records.append(FileRecord(path, size))
+        if added and self.loaded < FETCH_BATCH:
+            # Show the first screenful straight away; the rest loads on scroll.
+            self.beginInsertRows(QModelIndex(), self.loaded, min(len(self.records), FETCH_BATCH) - 1)
+            self.loaded = min(len(self.records), FETCH_BATCH)
+            self.endInsertRows()
+        return added
+
+    def clear(self):
+        self.beginResetModel()
+        self.records = []
+        self.loaded = 0
+        self.generation += 1
+        self.endResetModel()
+
+    def record(self, row):
+        return self.records[row]
+
+    def has_row(self, row, path, generation):
+        # Rows may have been cleared, and even re-added, since a worker was given them.
+        return generation == self.generation and 0 <= row < len(self.records) and self.records[row].path == path
+
+    def update(self, row, *keys, **changes):
+        """Set record attributes and repaint the given columns of ``row`` (all if none given)."""
+        if not 0 <= row < len(self.records):
+            return
+        record = self.records[row]
+        for name, value in changes.items():
+            setattr(record, name, value)
+        if row >= self.loaded:
+            return
+        columns = [self.columns.index(key) for key in keys if key in self.columns] if keys else None
+        if columns == []:
+            return
+        first, last = (min(columns), max(columns)) if columns else (0, len(self.columns) - 1)
+        self.dataChanged.emit(self.index(row, first), self.index(row, last))
+
+    def update_all(self, *keys, **changes):
+        for record in self.records:
+            for name, value in changes.items():
+                setattr(record, name, value)
+        if self.loaded:
+            columns = [self.columns.index(key) for key in keys if key in self.columns] or [0, len(self.columns) - 1]
+            self.dataChanged.emit(self.index(0, min(columns)), self.index(self.loaded - 1, max(columns)))
+
+
+class FileFilterProxy(QSortFilterProxyModel):
+    """Sorts on ``SORT_ROLE`` and filters on the file path.
+
+    Sorting or filtering first loads every record into the model, since
+    rows that were never fetched could not be placed otherwise.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSortRole(SORT_ROLE)
+        self.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.setFilterKeyColumn(0)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column >= 0 and self.sourceModel():
+            self.sourceModel().fetch_all()
+        super().sort(column, order)
+
+    def set_filter_text(self, text):
+        if text and self.sourceModel():
+            self.sourceModel().fetch_all()
+        self.setFilterFixedString(text)
+
+
+class ProgressDelegate(QStyledItemDelegate):
+    """Paints a progress bar from ``PROGRESS_ROLE`` instead of a widget per row."""
+
+    def paint(self, painter, option, index):
+        option_bar = QStyleOptionProgressBar()
+        option_bar.rect = option.rect.adjusted(1, 1, -1, -1)
+        option_bar.minimum = 0
+        option_bar.maximum = 100
+        option_bar.progress = index.data(PROGRESS_ROLE) or 0
+        option_bar.text = index.data(Qt.DisplayRole) or f"{option_bar.progress}%"
+        option_bar.textVisible = True
+        option_bar.state = option.state
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.CE_ProgressBar, option_bar, painter, option.widget)
+
+
+def create_file_view(model, parent=None, preview_height=None):
+    """A sortable QTableView over ``model`` through a ``FileFilterProxy``; returns ``(view, proxy)``.
+
+    With a ``preview`` column, rows are made ``preview_height`` pixels high
+    to fit the thumbnail strips.
+    """
+    proxy = FileFilterProxy(parent)
+    proxy.setSourceModel(model)
+    view = QTableView(parent)
+    view.setModel(proxy)
+    view.setSortingEnabled(True)
+    view.sortByColumn(-1, Qt.AscendingOrder)
+    view.setSelectionBehavior(QAbstractItemView.SelectRows)
+    view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+    view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+    # Fixed row heights let the view skip measuring every row.
+    view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+    view.verticalHeader().setDefaultSectionSize(max(view.fontMetrics().height(), preview_height or 0) + 8)
+    if 'preview' in model.columns:
+        view.setIconSize(QSize(preview_height * 8, preview_height))
+        if QPixmapCache.cacheLimit() < PREVIEW_CACHE_KB:
+            QPixmapCache.setCacheLimit(PREVIEW_CACHE_KB)
+    if 'progress' in model.columns:
+        view.setItemDelegateForColumn(model.column('progress'), ProgressDelegate(view))
+    return view, proxy
@@ -0,0 +1,13 @@
+def format_duration(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02}:{seconds % 60:02}"
+    return f"{seconds // 60:02}:{seconds % 60:02}"
+
+
+def format_bitrate(bit_rate):
+    if not bit_rate:
+        return "?"
+    return f"{bit_rate / 1000:.0f} kb/s"
@@ -0,0 +1,238 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtWidgets import QFileDialog, QMessageBox
+
+import analysis
+from file_table import ESTIMATE_COLUMNS, PENDING
+from metadata_cache import get_metadata_cache
+from watch_folder import same_folder
+from watch_worker import WatchWorker
+
+
+class ProbeWorker(QThread):
+    """Reads metadata for newly added rows off the GUI thread.
+
+    ``probe(path)`` is the engine's metadata reader. At most ``max_workers``
+    files are open at once, each only for as long as ``probe`` needs it, and
+    cached results skip the file entirely, so adding a thousand files never
+    holds a thousand demuxers.
+    """
+
+    result_ready = pyqtSignal(int, str, object, int)  # row, file, metadata, table generation
+    error_signal = pyqtSignal(int, str, str, int)  # row, file, message, table generation
+
+    def __init__(self, rows, generation, probe, max_workers=None):
+        super().__init__()
+        self.rows = rows
+        self.generation = generation
+        self.probe = probe
+        self.max_workers = max(1, max_workers or (os.cpu_count() or 1))
+        self.cancelled = False
+        self.metadata_cache = get_metadata_cache()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _probe(self, file):
+        if self.cancelled:
+            return None
+        return self.metadata_cache.get_or_probe(file, self.probe)
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._probe, file): (row, file) for row, file in self.rows}
+            for future in as_completed(futures):
+                row, file = futures[future]
+                if self.cancelled:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    return
+                try:
+                    self.result_ready.emit(row, file, future.result(), self.generation)
+                except Exception as e:
+                    self.error_signal.emit(row, file, str(e), self.generation)
+
+
+class EstimateWorker(QThread):
+    """Runs ``estimate(job)`` for each job dict, which needs ``row`` and ``input_file``."""
+
+    result_ready = pyqtSignal(int, str, object, int)  # row, file, estimate, table generation
+    error_signal = pyqtSignal(int, str, str, int)  # row, file, message, table generation
+
+    def __init__(self, jobs, generation, estimate):
+        super().__init__()
+        self.jobs = jobs
+        self.generation = generation
+        self.estimate = estimate
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        # One file at a time: each sample encode already uses every core.
+        for job in self.jobs:
+            if self.cancelled:
+                return
+            try:
+                self.result_ready.emit(job['row'], job['input_file'], self.estimate(job), self.generation)
+            except Exception as e:
+                self.error_signal.emit(job['row'], job['input_file'], str(e), self.generation)
+
+
+class CompressorWindowMixin:
+    """File list, estimate, resume and watch-folder handling shared by both windows.
+
+    The window provides ``files``, ``log``, ``settings``, ``journal``,
+    ``output_path``, ``watch_action``, ``watch_worker``, ``watch_queue``,
+    ``probe_workers``, ``estimate_workers``, ``batch_running``,
+    ``probe_metadata(path)``, ``update_action(row)``, ``on_probe_error`` and
+    ``compress_all(rows)``.
+    """
+
+    def add_files(self):
+        files, _ = QFileDialog.getOpenFileNames(self, "Select Video Files", "", "Videos (*.mp4 *.avi *.mov *.mkv)")
+        self.add_file_rows(files)
+
+    def add_file_rows(self, files):
+        rows = self.files.add_files(files)
+        if rows:
+            self.start_probe(rows)
+        return rows
+
+    def offer_resume(self):
+        files = self.journal.unfinished_inputs()
+        if not files:
+            return
+        answer = QMessageBox.question(
+            self, "Resume Batch",
+            f"{len(files)} file(s) from an interrupted batch were not finished. Add them back to the list?",
+        )
+        if answer == QMessageBox.Yes:
+            self.add_file_rows(files)
+        else:
+            self.journal.discard_unfinished()
+
+    def start_probe(self, rows):
+        worker = ProbeWorker(rows, self.files.generation, self.probe_metadata)
+        worker.result_ready.connect(self.on_probe_result)
+        worker.error_signal.connect(self.on_probe_error)
+        worker.finished.connect(lambda: self.probe_workers.remove(worker))
+        self.probe_workers.append(worker)
+        worker.start()
+
+    def on_probe_result(self, row, file, metadata, generation):
+        if not self.files.has_row(row, file, generation):
+            return
+        self.files.record(row).metadata = metadata
+        self.update_action(row)
+
+    def target_bit_rate(self, metadata):
+        return analysis.rate_mode_bit_rate(metadata, self.rate_combo.currentText(), self.target_spin.value())
+
+    def refresh_actions(self):
+        self.clear_estimates()
+        for row, record in enumerate(self.files.records):
+            if record.metadata is not None:
+                self.update_action(row)
+
+    def start_estimates(self, jobs, estimate):
+        """Marks ``jobs`` as pending and estimates them with ``estimate(job)`` in the background."""
+        if not jobs:
+            return
+        for job in jobs:
+            self.files.update(job['row'], *ESTIMATE_COLUMNS, estimate=PENDING)
+        self.log.append(f"Estimating output for {len(jobs)} file(s)...")
+        worker = EstimateWorker(jobs, self.files.generation, estimate)
+        worker.result_ready.connect(self.on_estimate_result)
+        worker.error_signal.connect(self.on_estimate_error)
+        worker.finished.connect(lambda: self.estimate_workers.remove(worker))
+        self.estimate_workers.append(worker)
+        worker.start()
+
+    def cancel_estimates(self):
+        for worker in self.estimate_workers:
+            worker.cancel()
+
+    def on_estimate_result(self, row, file, estimate, generation):
+        # Results that were already queued when the settings changed are stale.
+        if self.sender().cancelled or not self.files.has_row(row, file, generation):
+            return
+        self.files.update(row, *ESTIMATE_COLUMNS, estimate=estimate)
+
+    def on_estimate_error(self, row, file, message, generation):
+        self.log.append(f"[ERROR] Estimate failed for {os.path.basename(file)}: {message}")
+        if not self.sender().cancelled and self.files.has_row(row, file, generation):
+            self.files.update(row, *ESTIMATE_COLUMNS, estimate=message)
+
+    def clear_estimates(self):
+        # Estimates only hold for the settings they were made with.
+        self.cancel_estimates()
+        self.files.update_all(*ESTIMATE_COLUMNS, estimate=None)
+
+    def clear_table(self):
+        for worker in self.probe_workers:
+            worker.cancel()
+        self.cancel_estimates()
+        self.watch_queue.clear()
+        self.files.clear()
+
+    def toggle_watch(self, enabled):
+        if not enabled:
+            self.stop_watching()
+            self.settings.setValue("watch_enabled", "false")
+            return
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder to Watch", self.settings.value("watch_folder", ""))
+        if folder and not os.path.isdir(self.output_path.text()):
+            QMessageBox.critical(self, "Error", "Please select a valid output folder before watching a folder.")
+            folder = ""
+        elif folder and same_folder(folder, self.output_path.text()):
+            QMessageBox.critical(self, "Error", "The watched folder cannot also be the output folder.")
+            folder = ""
+        if not folder:
+            self.watch_action.setChecked(False)
+            return
+        self.settings.setValue("watch_folder", folder)
+        self.settings.setValue("watch_enabled", "true")
+        self.start_watching(folder)
+
+    def start_watching(self, folder):
+        self.watch_worker = WatchWorker(folder, exclude=[self.output_path.text()])
+        self.watch_worker.files_ready.connect(self.on_watch_files)
+        self.watch_worker.error_signal.connect(lambda message: self.log.append(f"[ERROR] {message}"))
+        self.watch_worker.start()
+        self.watch_action.setChecked(True)
+        self.log.append(f"Watching {folder} for new videos")
+
+    def stop_watching(self):
+        if self.watch_worker:
+            self.watch_worker.stop()
+            self.watch_worker.wait()
+            self.watch_worker = None
+            self.log.append("Stopped watching folder")
+        self.watch_action.setChecked(False)
+
+    def on_watch_files(self, files):
+        self.log.append(f"Watch folder: {len(files)} new file(s)")
+        first_row = len(self.files.records)
+        self.add_file_rows(files)
+        self.watch_queue.extend(range(first_row, len(self.files.records)))
+        self.start_watch_batch()
+
+    def mark_watched_done(self, path):
+        # Only files the watch folder handed over are affected; others are ignored.
+        if self.watch_worker:
+            self.watch_worker.done(path)
+
+    def start_watch_batch(self):
+        if self.batch_running or not self.watch_queue:
+            return
+        rows, self.watch_queue = self.watch_queue, []
+        self.compress_all(rows)
+
+    def closeEvent(self, event):
+        if self.watch_worker:
+            self.watch_worker.stop()
+            self.watch_worker.wait()
+        super().closeEvent(event)
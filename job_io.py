@@ -0,0 +1,294 @@
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import analysis
+
+# Free space to leave on the output volume on top of every running job's estimate.
+MIN_FREE_BYTES = 256 * 1024 * 1024
+# Headroom over an estimate, which is only ever a projection.
+SIZE_MARGIN = 1.2
+COPY_BUFFER = 4 * 1024 * 1024
+# reserve_output(job, wait=False) result: the job fits once running jobs release their room.
+OUTPUT_BUSY = "busy"
+
+
+def volume_of(path):
+    """Device id of the volume holding ``path`` (or its nearest existing parent)."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return os.stat(path).st_dev
+
+
+def estimate_output_size(job, input_size):
+    """Bytes ``job`` is expected to write, or None if there is nothing to go on.
+
+    Uses the sample-encode estimate when the GUI has one (``estimated_size``),
+    the target bitrate of a two-pass job, and the input's size for a remux.
+    A CRF encode without an estimate usually ends up far smaller than its
+    input, so it gets no projection.
+    """
+    if job.get('estimated_size'):
+        return int(job['estimated_size'] * SIZE_MARGIN)
+    bit_rate = job.get('video_bit_rate') or (job.get('profile') or {}).get('bit_rate')
+    if bit_rate and job.get('duration'):
+        return int((bit_rate + job.get('audio_bit_rate', 0)) * job['duration'] / 8 * SIZE_MARGIN)
+    if job.get('action') == analysis.REMUX:
+        return int(input_size * SIZE_MARGIN)
+    return None
+
+
+def output_key(path):
+    """Key under which two output paths are the same file."""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def split_duplicate_outputs(jobs):
+    """Split ``jobs`` into the ones to run and ``(job, earlier job)`` pairs that would overwrite an earlier output.
+
+    Outputs are named after the input's base name, so ``a/clip.mp4`` and
+    ``b/clip.mp4`` would otherwise race for the same output and partial file.
+    """
+    unique, duplicates, writers = [], [], {}
+    for job in jobs:
+        key = output_key(job['output_file'])
+        if key in writers:
+            duplicates.append((job, writers[key]))
+        else:
+            writers[key] = job
+            unique.append(job)
+    return unique, duplicates
+
+
+def _megabytes(size):
+    return f"{max(size, 0) / (1024 * 1024):.0f} MB"
+
+
+class IOScheduler:
+    """Disk space and input I/O for a batch of jobs.
+
+    ``reserve_output(job)`` checks the output volume has room for the job's
+    estimated size, counting what running jobs have already reserved, and
+    waits for them to release it if the job would fit on its own.
+    ``open_input(job)`` is a context manager giving the path to read the
+    job from. With ``prefetch`` it copies the inputs of the next
+    ``prefetch_ahead`` jobs to ``scratch_dir`` on a background thread, and
+    hands out a job's local copy if it is ready when the job starts; a job
+    whose copy is still in flight reads in place rather than waiting for
+    it. ``readers_per_volume`` caps how many jobs and copies
+    read from one volume at once; it only applies to volumes other than
+    the scratch directory's, which is assumed to be local.
+    """
+
+    def __init__(self, jobs, prefetch=False, scratch_dir=None, readers_per_volume=0, on_log=print,
+                 min_free=MIN_FREE_BYTES, prefetch_ahead=1):
+        self.jobs = list(jobs)
+        self.prefetch = prefetch
+        self.prefetch_ahead = max(1, prefetch_ahead)
+        self.readers_per_volume = readers_per_volume
+        self.on_log = on_log
+        self.min_free = min_free
+        self._lock = threading.Lock()
+        self._space_freed = threading.Condition(self._lock)
+        self._reserved = {}  # output volume -> bytes
+        self._job_reservations = {}  # output file -> (volume, bytes)
+        self._readers = {}  # input volume -> semaphore
+        self._started = set()
+        self._prefetches = {}  # input file -> future of the local path
+        self._next_job = 0  # jobs before this one have all started
+        self._abandoned = set()  # inputs whose copy is no longer wanted
+        self._scratch_parent = scratch_dir or tempfile.gettempdir()
+        self._scratch_dir = None
+        self._copies = 0
+        self._scratch_volume = volume_of(self._scratch_parent)
+        self._copier = ThreadPoolExecutor(max_workers=1) if prefetch else None
+
+    def reserve_output(self, job, wait=True):
+        """Reserve room for ``job``'s output; returns None, or why there is not enough.
+
+        While other jobs hold reservations on the same volume a job that
+        does not fit beside them waits for one to be released, or with
+        ``wait=False`` returns ``OUTPUT_BUSY``. It only fails once it does
+        not fit with nothing else reserved.
+        """
+        try:
+            input_size = os.path.getsize(job['input_file'])
+            output_dir = os.path.dirname(os.path.abspath(job['output_file']))
+            volume = volume_of(output_dir)
+        except OSError:
+            # Let the job itself report the missing input or output folder.
+            return None
+        expected = estimate_output_size(job, input_size)
+        needed = expected or 0
+        name = os.path.basename(job['input_file'])
+        waiting = False
+        with self._space_freed:
+            while True:
+                try:
+                    free = shutil.disk_usage(output_dir).free
+                except OSError:
+                    return None
+                reserved = self._reserved.get(volume, 0)
+                available = free - reserved - self.min_free
+                if needed <= available:
+                    break
+                if not reserved:
+                    if expected is None:
+                        return f"only {_megabytes(free)} are free on the output drive"
+                    return f"needs about {_megabytes(needed)} but only {_megabytes(available)} are free on the output drive"
+                if not wait:
+                    return OUTPUT_BUSY
+                if not waiting:
+                    waiting = True
+                    self.on_log(f"Waiting for room on the output drive for {name}")
+                self._space_freed.wait()
+            self._reserved[volume] = reserved + needed
+            self._job_reservations[job['output_file']] = (volume, needed)
+        if expected is None and input_size * SIZE_MARGIN > available:
+            self.on_log(f"[WARNING] {name} may not fit on the output drive if it compresses poorly: "
+                        f"{_megabytes(available)} free for a {_megabytes(input_size)} input")
+        return None
+
+    def release_output(self, job):
+        with self._space_freed:
+            volume, needed = self._job_reservations.pop(job['output_file'], (None, 0))
+            if volume is not None:
+                self._reserved[volume] -= needed
+                self._space_freed.notify_all()
+
+    def _reader_slot(self, path):
+        if not self.readers_per_volume:
+            return None
+        try:
+            volume = volume_of(path)
+        except OSError:
+            return None
+        if volume == self._scratch_volume:
+            return None
+        with self._lock:
+            if volume not in self._readers:
+                self._readers[volume] = threading.BoundedSemaphore(self.readers_per_volume)
+            return self._readers[volume]
+
+    @contextmanager
+    def reading(self, path):
+        """Hold one of the reader slots of ``path``'s volume."""
+        slot = self._reader_slot(path)
+        if slot is None:
+            yield
+            return
+        with slot:
+            yield
+
+    @contextmanager
+    def open_input(self, job):
+        with self._lock:
+            self._started.add(job['input_file'])
+            prefetched = self._prefetches.pop(job['input_file'], None)
+        self._prefetch_next()
+        local = None
+        if prefetched and prefetched.done():
+            local = prefetched.result()
+        elif prefetched:
+            # Waiting for the copy would hold up the job for longer than reading in place.
+            self._discard(job['input_file'], prefetched)
+        if local:
+            try:
+                yield local
+            finally:
+                self._remove(local)
+            return
+        with self.reading(job['input_file']):
+            yield job['input_file']
+
+    def skip_input(self, job):
+        """Mark ``job`` as started without reading it, dropping its prefetched copy."""
+        with self._lock:
+            self._started.add(job['input_file'])
+            prefetched = self._prefetches.pop(job['input_file'], None)
+        if prefetched:
+            self._discard(job['input_file'], prefetched)
+        self._prefetch_next()
+
+    def _discard(self, path, prefetched):
+        """Drop a prefetch that will not be used, stopping its copy and deleting what it wrote."""
+        if prefetched.cancel():
+            return
+        self._abandoned.add(path)
+        prefetched.add_done_callback(lambda future: future.result() and self._remove(future.result()))
+
+    def _prefetch_next(self):
+        if not self._copier:
+            return
+        with self._lock:
+            while self._next_job < len(self.jobs) and self.jobs[self._next_job]['input_file'] in self._started:
+                self._next_job += 1
+            # A copy per job that can start next hides the reads; more only fills the scratch disk.
+            upcoming = self.jobs[self._next_job:self._next_job + self.prefetch_ahead]
+            queued = sum(self._size(path) for path in self._prefetches)
+            for job in upcoming:
+                path = job['input_file']
+                if path in self._started or path in self._prefetches or not self._worth_copying(path, queued):
+                    continue
+                queued += self._size(path)
+                self._prefetches[path] = self._copier.submit(self._copy, path)
+
+    def _size(self, path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _worth_copying(self, path, queued=0):
+        """True if ``path`` is on another volume and fits on the scratch disk after ``queued`` bytes."""
+        try:
+            if volume_of(path) == self._scratch_volume:
+                return False
+            return shutil.disk_usage(self._scratch_parent).free - queued - os.path.getsize(path) > self.min_free
+        except OSError:
+            return False
+
+    def _copy(self, path):
+        local = None
+        try:
+            with self._lock:
+                if self._scratch_dir is None:
+                    self._scratch_dir = tempfile.mkdtemp(prefix="video_compressor_prefetch_", dir=self._scratch_parent)
+                self._copies += 1
+                local = os.path.join(self._scratch_dir, f"{self._copies}_{os.path.basename(path)}")
+            with self.reading(path), open(path, "rb") as src, open(local, "wb") as dst:
+                while True:
+                    if path in self._abandoned:
+                        # Its job started while this was still copying and reads the original.
+                        break
+                    chunk = src.read(COPY_BUFFER)
+                    if not chunk:
+                        return local
+                    dst.write(chunk)
+            self._remove(local)
+            return None
+        except OSError as e:
+            self.on_log(f"[WARNING] Could not prefetch {os.path.basename(path)}, reading it in place: {e}")
+            if local:
+                self._remove(local)
+            return None
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def close(self):
+        """Wait for any copy in flight and delete the scratch directory."""
+        if self._copier:
+            self._copier.shutdown(wait=True)
+        if self._scratch_dir:
+            shutil.rmtree(self._scratch_dir, ignore_errors=True)
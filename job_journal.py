@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metadata_cache import default_cache_dir
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+DONE_RETENTION_SECONDS = 30 * 24 * 3600
+
+
+def partial_output_path(output_file):
+    # Keep the extension so PyAV/ffmpeg still pick the right container.
+    folder, filename = os.path.split(output_file)
+    name, ext = os.path.splitext(filename)
+    return os.path.join(folder, f".{name}.partial{ext}")
+
+
+def prepare_partial_output(output_file):
+    partial_file = partial_output_path(output_file)
+    if os.path.exists(partial_file):
+        os.remove(partial_file)
+    return partial_file
+
+
+def finalize_output(output_file, success):
+    """Move a finished partial file into place, or discard a failed one."""
+    partial_file = partial_output_path(output_file)
+    if not success:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        return False
+    os.replace(partial_file, output_file)
+    return True
+
+
+def output_matches(output_file, expected_duration, probe):
+    """Check that an existing output opens and is about as long as its input."""
+    try:
+        metadata = probe(output_file)
+    except Exception:
+        return False
+    if not expected_duration:
+        return True
+    duration = metadata.get('duration') or 0
+    return abs(duration - expected_duration) <= max(1.0, expected_duration * 0.02)
+
+
+def job_signature(job):
+    cmd = job.get('cmd') or []
+    paths = {job['input_file'], job['output_file'], partial_output_path(job['output_file'])}
+    profile = job.get('profile') or {}
+    return json.dumps([
+        job.get('resolution'),
+        profile.get('crf'),
+        profile.get('preset'),
+        profile.get('bit_rate'),
+        profile.get('scaler'),
+        job.get('action'),
+        job.get('copy_extra_streams'),
+        [arg for arg in cmd[1:] if arg not in paths],
+    ])
+
+
+class JobJournal:
+    """On-disk record of batch jobs so an interrupted batch can be resumed.
+
+    Jobs are keyed by input path, size and mtime, output path and encode
+    settings, so changing any of them makes the job run again. If the
+    journal file cannot be opened it is kept in memory for this session.
+    """
+
+    def __init__(self, engine, path=None, on_log=print):
+        self.engine = engine
+        self._lock = threading.Lock()
+        try:
+            self._open(path)
+        except (OSError, sqlite3.Error) as e:
+            on_log(f"[WARNING] Could not open the job journal, interrupted batches will not be resumable: {e}")
+            self._open(":memory:")
+
+    def _open(self, path):
+        if path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            path = os.path.join(default_cache_dir(), "jobs.sqlite3")
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "key TEXT PRIMARY KEY, engine TEXT, input_path TEXT, output_path TEXT, "
+            "state TEXT, output_size INTEGER, updated REAL)"
+        )
+        self._conn.execute(
+            "DELETE FROM jobs WHERE state = ? AND updated < ?", (DONE, time.time() - DONE_RETENTION_SECONDS)
+        )
+        self._conn.commit()
+
+    def job_key(self, job):
+        try:
+            st = os.stat(job['input_file'])
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        except OSError:
+            size = mtime_ns = -1
+        parts = [
+            self.engine,
+            os.path.abspath(job['input_file']),
+            str(size),
+            str(mtime_ns),
+            os.path.abspath(job['output_file']),
+            job_signature(job),
+        ]
+        return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def set_state(self, job, state):
+        output_size = None
+        if state == DONE and os.path.exists(job['output_file']):
+            output_size = os.path.getsize(job['output_file'])
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (key, engine, input_path, output_path, state, output_size, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.job_key(job), self.engine, os.path.abspath(job['input_file']),
+                 os.path.abspath(job['output_file']), state, output_size, time.time()),
+            )
+            self._conn.commit()
+
+    def start_batch(self, jobs):
+        for job in jobs:
+            self.set_state(job, PENDING)
+
+    def is_complete(self, job, probe=None):
+        if not os.path.exists(job['output_file']):
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, output_size FROM jobs WHERE key = ?", (self.job_key(job),)
+            ).fetchone()
+            other = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE output_path = ? LIMIT 1", (os.path.abspath(job['output_file']),)
+            ).fetchone()
+        if row:
+            return row[0] == DONE and row[1] == os.path.getsize(job['output_file'])
+        if other:
+            # Written by an earlier batch with different settings.
+            return False
+        # An output the journal has never seen (e.g. from before it existed)
+        # only counts if it opens and has the full duration.
+        if probe and output_matches(job['output_file'], job.get('duration'), probe):
+            self.set_state(job, DONE)
+            return True
+        return False
+
+    def filter_pending(self, jobs, probe=None, on_log=print):
+        pending = []
+        for job in jobs:
+            if self.is_complete(job, probe):
+                on_log(f"Already done: {os.path.basename(job['output_file'])}")
+            else:
+                pending.append(job)
+        return pending
+
+    def unfinished_inputs(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT input_path FROM jobs WHERE engine = ? AND state IN (?, ?) ORDER BY updated",
+                (self.engine, PENDING, RUNNING),
+            ).fetchall()
+        return [row[0] for row in rows if os.path.exists(row[0])]
+
+    def discard_unfinished(self):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE engine = ? AND state IN (?, ?)", (self.engine, PENDING, RUNNING)
+            )
+            self._conn.commit()
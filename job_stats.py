@@ -0,0 +1,107 @@
+import json
+import os
+import time
+
+from metadata_cache import default_cache_dir
+
+STAGES = ("first_pass", "demux", "decode", "reformat", "encode", "mux", "audio")
+COUNTERS = ("frames", "packets_in", "bytes_in", "packets_out", "bytes_out", "mux_warnings")
+
+
+def default_report_dir():
+    return os.path.join(default_cache_dir(), "reports")
+
+
+class JobStats:
+    """Wall time per pipeline stage and counters for one compression job.
+
+    Stages are timed around the PyAV calls in the encode loop, so they add
+    up to a little less than the job's wall time; ``audio`` covers decoding
+    and re-encoding audio that cannot be copied, and ``first_pass`` the
+    whole analysis pass of a two-pass encode.
+
+    Chunked jobs ``merge`` the stages of segments that ran side by side in
+    worker processes, so their stage seconds add up to more than the wall
+    time; ``segments`` counts how many were merged.
+    """
+
+    def __init__(self):
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.segments = 0
+        self.started = time.perf_counter()
+
+    def timed(self, stage, iterable):
+        """Yield from ``iterable``, charging the time spent waiting on it to ``stage``."""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stages[stage] += time.perf_counter() - started
+                return
+            self.stages[stage] += time.perf_counter() - started
+            yield item
+
+    def merge(self, other):
+        """Add the ``as_dict()`` of another JobStats, e.g. from a segment worker."""
+        for stage, seconds in other['stages'].items():
+            self.stages[stage] += seconds
+        for name, count in other['counters'].items():
+            self.counters[name] += count
+        self.segments += 1
+
+    def as_dict(self):
+        return {'stages': dict(self.stages), 'counters': dict(self.counters)}
+
+    def report(self, job, ok, profile_file=None):
+        wall = time.perf_counter() - self.started
+        return {
+            'input_file': job['input_file'],
+            'output_file': job['output_file'],
+            'ok': ok,
+            'action': job.get('action'),
+            'chunked': bool(job.get('chunked')),
+            'finished': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'wall_seconds': round(wall, 3),
+            'fps': round(self.counters['frames'] / wall, 1) if wall else None,
+            'stages': {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+            'counters': dict(self.counters),
+            'segments': self.segments,
+            'profile_file': profile_file,
+        }
+
+
+def report_path(report_dir, job, ext):
+    name = os.path.splitext(os.path.basename(job['output_file']))[0]
+    return os.path.join(report_dir, f"{name}.{time.strftime('%Y%m%d-%H%M%S')}{ext}")
+
+
+def write_report(report_dir, report):
+    os.makedirs(report_dir, exist_ok=True)
+    path = report_path(report_dir, report, ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def stage_shares(report):
+    """Each stage's share of the job's time, largest first, leaving out idle stages.
+
+    That is the wall time, except for chunked jobs whose stages overlap in
+    parallel segments: there it is the sum of all stage times.
+    """
+    if report.get('segments'):
+        total = sum(report['stages'].values()) or 1e-6
+    else:
+        total = report['wall_seconds'] or 1e-6
+    shares = [(stage, seconds / total) for stage, seconds in report['stages'].items() if seconds >= 0.0005]
+    return sorted(shares, key=lambda share: share[1], reverse=True)
+
+
+def format_stage_breakdown(report):
+    breakdown = ", ".join(f"{stage} {share:.0%}" for stage, share in stage_shares(report)) or "no stages timed"
+    if report.get('segments'):
+        breakdown += f" of stage time over {report['segments']} parallel segments"
+    return breakdown
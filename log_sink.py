@@ -0,0 +1,91 @@
+import logging
+import logging.handlers
+import os
+import threading
+from collections import deque
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSlot
+from PyQt5.QtGui import QTextCursor
+
+DEFAULT_MAX_BLOCKS = 5000
+DEFAULT_FLUSH_INTERVAL_MS = 200
+
+
+class LogSink(QObject):
+    """Buffers log lines and writes them to a text widget in batches.
+
+    Lines are held in a ring buffer and flushed on a timer, so a burst of
+    output costs one document edit instead of one reflow per line. The
+    widget keeps at most ``max_blocks`` lines. When ``log_file`` is set,
+    every line is also written to a rotating file, including lines the
+    widget has already dropped.
+    """
+
+    def __init__(self, widget, max_blocks=DEFAULT_MAX_BLOCKS, flush_interval=DEFAULT_FLUSH_INTERVAL_MS,
+                 log_file=None, max_file_bytes=10 * 1024 * 1024, backup_count=3, parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        self.widget.document().setMaximumBlockCount(max_blocks)
+        self.pending = deque(maxlen=max_blocks)
+        self._lock = threading.Lock()
+        self.file_logger = None
+        self.set_log_file(log_file, max_file_bytes, backup_count)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(flush_interval)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start()
+
+    def set_log_file(self, log_file, max_file_bytes=10 * 1024 * 1024, backup_count=3):
+        if self.file_logger:
+            for handler in list(self.file_logger.handlers):
+                self.file_logger.removeHandler(handler)
+                handler.close()
+            self.file_logger = None
+        if not log_file:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_file_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.file_logger = logging.getLogger(f"{__name__}.{id(self)}")
+        self.file_logger.propagate = False
+        self.file_logger.setLevel(logging.INFO)
+        self.file_logger.addHandler(handler)
+
+    @pyqtSlot(str)
+    def append(self, line):
+        with self._lock:
+            self.pending.append(line)
+        if self.file_logger:
+            self.file_logger.info(line)
+
+    def clear(self):
+        with self._lock:
+            self.pending.clear()
+        self.widget.clear()
+
+    def flush(self):
+        with self._lock:
+            if not self.pending:
+                return
+            lines = list(self.pending)
+            self.pending.clear()
+
+        scrollbar = self.widget.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 4
+        document = self.widget.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        text = "\n".join(lines)
+        if not document.isEmpty():
+            text = "\n" + text
+        cursor.insertText(text)
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def close(self):
+        self.timer.stop()
+        self.flush()
+        self.set_log_file(None)
@@ -0,0 +1,101 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 20000
+
+
+def default_cache_dir():
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "VideoCompressor")
+
+
+def file_signature(filepath):
+    path = os.path.abspath(filepath)
+    st = os.stat(path)
+    return path, st.st_size, st.st_mtime_ns
+
+
+class MetadataCache:
+    """Probe results stored in SQLite, keyed by absolute path, size and mtime."""
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        if path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            path = os.path.join(default_cache_dir(), "metadata.sqlite3")
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, data TEXT, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)")
+        self._conn.commit()
+
+    def get(self, filepath):
+        try:
+            path, size, mtime_ns = file_signature(filepath)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM metadata WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, size, mtime_ns),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE metadata SET last_used = ? WHERE path = ?", (time.time(), path))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, filepath, metadata):
+        try:
+            path, size, mtime_ns = file_signature(filepath)
+        except OSError:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata (path, size, mtime_ns, data, last_used) VALUES (?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, json.dumps(metadata), time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM metadata WHERE path IN "
+                "(SELECT path FROM metadata ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def get_or_probe(self, filepath, probe):
+        metadata = self.get(filepath)
+        if metadata is None:
+            metadata = probe(filepath)
+            self.put(filepath, metadata)
+        return metadata
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_metadata_cache():
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            try:
+                _shared_cache = MetadataCache()
+            except (OSError, sqlite3.Error):
+                # Unwritable app data directory: keep the cache for this session only.
+                _shared_cache = MetadataCache(":memory:")
+        return _shared_cache
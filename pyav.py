@@ -1,7 +1,6 @@
+import multiprocessing
 import os
 import sys
-import av
-import re
 from datetime import datetime
 
 import qdarkstyle
@@ -10,73 +9,108 @@ from PyQt5.QtGui import QDropEvent
 from PyQt5.QtWidgets import (
     QAction, QApplication, QComboBox, QFileDialog, QHeaderView, QLabel, QLineEdit,
     QMainWindow, QMenuBar, QMessageBox, QPushButton, QTableWidget, QTableWidgetItem,
-    QTextEdit, QVBoxLayout, QHBoxLayout, QWidget, QProgressBar
+    QTextEdit, QVBoxLayout, QHBoxLayout, QWidget, QProgressBar, QSpinBox, QCheckBox
 )
 
-
-def sanitize_filename(name):
-    return re.sub(r'[<>:"/\\|?*]', "_", name)
+import analysis
+from engine import (
+    FORMATS,
+    X264_PRESETS,
+    BatchCompressor,
+    build_encoding_profile,
+    build_job,
+    default_job_count,
+    estimate_job,
+    format_stats,
+    get_video_metadata,
+    make_output_path,
+)
+from file_table import FileTableModel, create_file_view
+from formatting import format_bitrate, format_duration
+from gui_common import CompressorWindowMixin
+from job_io import IOScheduler, split_duplicate_outputs
+from job_journal import JobJournal
+from job_stats import default_report_dir, stage_shares
+from log_sink import LogSink
+from metadata_cache import default_cache_dir, get_metadata_cache
+from thumbnail_worker import ThumbnailWorker
+from thumbnails import THUMBNAIL_HEIGHT
+from watch_folder import same_folder
+
+
+# With prefetching, at most this many jobs and copies read from one (presumably remote) drive at once.
+PREFETCH_READERS_PER_VOLUME = 2
+
+FILE_COLUMNS = ['path', 'preview', 'resolution', 'duration', 'size', 'est_size', 'est_time', 'ssim', 'action', 'progress']
+
+STATS_COLUMNS = [
+    ("File", 'file'),
+    ("Time", 'wall_seconds'),
+    ("FPS", 'fps'),
+    ("First Pass", 'first_pass'),
+    ("Demux", 'demux'),
+    ("Decode", 'decode'),
+    ("Scale", 'reformat'),
+    ("Encode", 'encode'),
+    ("Mux", 'mux'),
+    ("Audio", 'audio'),
+    ("Frames", 'frames'),
+    ("Mux Warnings", 'mux_warnings'),
+]
 
 
 class CompressWorker(QThread):
     progress_update = pyqtSignal(int, int)  # frames_done, total_frames_all_files
     file_progress_update = pyqtSignal(int, int)  # row, percent
+    file_stats_update = pyqtSignal(int, object, int)  # row, {percent, fps, speed, eta}, table generation
+    batch_stats_update = pyqtSignal(object)  # {frames_done, total_frames, percent, fps, speed, eta}
+    job_stats_update = pyqtSignal(object)  # job_stats.JobStats.report()
+    job_finished = pyqtSignal(object, bool)  # job, ok
     log_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
 
-    def __init__(self, jobs):
+    def __init__(self, jobs, generation, max_workers=None, journal=None, report_dir=None, profile_jobs=False,
+                 prefetch=False):
         super().__init__()
         self.jobs = jobs
-        self.total_frames = sum(job['total_frames'] for job in jobs)
-        self.frames_done = 0
+        self.generation = generation
+        io = IOScheduler(jobs, prefetch=prefetch, readers_per_volume=PREFETCH_READERS_PER_VOLUME if prefetch else 0,
+                         on_log=self.log_signal.emit, prefetch_ahead=max_workers or 1)
+        self.batch = BatchCompressor(
+            jobs,
+            max_workers,
+            on_log=self.log_signal.emit,
+            on_file_progress=self._emit_file_progress,
+            on_batch_progress=self._emit_batch_progress,
+            journal=journal,
+            on_job_stats=self.job_stats_update.emit,
+            report_dir=report_dir,
+            profile_jobs=profile_jobs,
+            io=io,
+            on_job_finished=self.job_finished.emit,
+        )
+        self.total_frames = self.batch.total_frames
+
+    def _emit_file_progress(self, row, stats):
+        self.file_progress_update.emit(row, stats['percent'])
+        self.file_stats_update.emit(row, stats, self.generation)
+
+    def _emit_batch_progress(self, stats):
+        self.progress_update.emit(stats['frames_done'], stats['total_frames'])
+        self.batch_stats_update.emit(stats)
 
     def run(self):
-        for job in self.jobs:
-            in_container = out_container = None
-            try:
-                in_container = av.open(job['input_file'])
-                out_container = av.open(str(job['output_file']), mode="w")
-                in_stream = next(s for s in in_container.streams if s.type == "video")
-                out_stream = out_container.add_stream("libx264", rate=in_stream.average_rate)
-                out_stream.width = in_stream.width if not job['resolution'] else job['resolution'][0]
-                out_stream.height = in_stream.height if not job['resolution'] else job['resolution'][1]
-                out_stream.pix_fmt = "yuv420p"
-
-                frame_count = 0
-                for packet in in_container.demux(in_stream):
-                    if packet.stream.type != "video":
-                        continue
-                    for frame in packet.decode():
-                        frame_count += 1
-                        self.frames_done += 1
-                        if job['resolution']:
-                            frame = frame.reformat(width=out_stream.width, height=out_stream.height)
-                        for out_packet in out_stream.encode(frame):
-                            try:
-                                out_container.mux(out_packet)
-                            except Exception as mux_err:
-                                pts = frame.pts or "?"
-                                self.log_signal.emit(f"[WARNING] muxing failed at frame {frame_count} (PTS={pts}): {mux_err}")
-                        percent = int((frame_count / job['total_frames']) * 100)
-                        self.file_progress_update.emit(job['row'], percent)
-                        self.progress_update.emit(self.frames_done, self.total_frames)
-
-                for pkt in out_stream.encode():
-                    out_container.mux(pkt)
-
-                self.file_progress_update.emit(job['row'], 100)
-                self.log_signal.emit(f"✅ Finished: {job['output_file']}")
-            except Exception as e:
-                self.log_signal.emit(f"[ERROR] Compressing {job['input_file']}: {e}")
-            finally:
-                if in_container:
-                    in_container.close()
-                if out_container:
-                    out_container.close()
+        self.batch.run()
         self.finished_signal.emit()
 
 
-class PyAVCompressor(QMainWindow):
+def estimate_row(job):
+    return estimate_job(job['input_file'], job['metadata'], job['profile'], job['resolution'])
+
+
+class PyAVCompressor(CompressorWindowMixin, QMainWindow):
+    probe_metadata = staticmethod(get_video_metadata)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Video Compressor Tool")
@@ -87,22 +121,44 @@ class PyAVCompressor(QMainWindow):
         apply_theme(QApplication.instance(), self.dark_mode)
         self.main_layout = QVBoxLayout(self.central_widget)
         self.show_log = self.settings.value("show_log", "true") == "true"
+        self.metadata_cache = get_metadata_cache()
+        self.batch_running = False
+        self.probe_workers = []
+        self.estimate_workers = []
+        self.watch_worker = None
+        self.watch_queue = []
+        self.thumbnail_worker = ThumbnailWorker()
+        self.thumbnail_worker.thumbnail_ready.connect(self.on_thumbnail_ready)
         self.init_ui()
+        self.journal = JobJournal("pyav", on_log=self.log.append)
         self.setAcceptDrops(True)
+        # Previews are a nicety: never let them compete with encoding for the CPU.
+        self.thumbnail_worker.start(QThread.LowestPriority)
+        watch_folder = self.settings.value("watch_folder", "")
+        if self.settings.value("watch_enabled", "false") == "true" and os.path.isdir(watch_folder) \
+                and os.path.isdir(self.output_path.text()) and not same_folder(watch_folder, self.output_path.text()):
+            self.start_watching(watch_folder)
 
     def init_ui(self):
-        self.table = QTableWidget(0, 5)
-        self.table.setHorizontalHeaderLabels(["File Path", "Resolution", "Duration", "Size", "Progress"])
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.files = FileTableModel(FILE_COLUMNS, self)
+        self.table, self.table_proxy = create_file_view(self.files, self, THUMBNAIL_HEIGHT)
+        self.table.setColumnHidden(self.files.column('preview'), not self.thumbnails_enabled())
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter files...")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.textChanged.connect(self.table_proxy.set_filter_text)
 
         self.add_files_button = QPushButton("Add Videos")
         self.clear_files_button = QPushButton("Clear List")
+        self.estimate_button = QPushButton("Estimate Output")
         self.add_files_button.clicked.connect(self.add_files)
         self.clear_files_button.clicked.connect(self.clear_table)
+        self.estimate_button.clicked.connect(self.estimate_all)
 
         file_button_layout = QHBoxLayout()
         file_button_layout.addWidget(self.add_files_button)
         file_button_layout.addWidget(self.clear_files_button)
+        file_button_layout.addWidget(self.estimate_button)
 
         self.output_path = QLineEdit()
         self.output_path.setText(self.settings.value("output_path", ""))
@@ -114,40 +170,112 @@ class PyAVCompressor(QMainWindow):
         output_layout.addWidget(self.browse_output)
 
         self.res_combo = QComboBox()
-        self.res_combo.addItems(["Original", "1080p", "720p", "480p"])
-        self.scale_map = {"1080p": (1920, 1080), "720p": (1280, 720), "480p": (854, 480)}
+        self.res_combo.addItems(["Original"] + list(analysis.SCALE_MAP))
+        self.scale_map = analysis.SCALE_MAP
 
         self.format_combo = QComboBox()
-        self.format_combo.addItems(["mp4", "avi", "mov", "mkv"])
+        self.format_combo.addItems(FORMATS)
+
+        self.scaler_combo = QComboBox()
+        self.scaler_combo.addItems(list(analysis.SCALERS))
+        self.scaler_combo.setCurrentText(self.settings.value("scaler", "Bicubic"))
+        self.scaler_combo.setToolTip("Interpolation used when downscaling")
+
+        self.quality_combo = QComboBox()
+        self.quality_combo.addItems(list(analysis.QUALITY_CRF))
+        self.quality_combo.setCurrentText(self.settings.value("quality", "Medium Quality"))
+
+        self.preset_combo = QComboBox()
+        self.preset_combo.addItems(X264_PRESETS)
+        self.preset_combo.setCurrentText(self.settings.value("preset", "fast"))
+
+        self.threads_spin = QSpinBox()
+        self.threads_spin.setRange(0, max(default_job_count(), 64))
+        self.threads_spin.setSpecialValueText("Auto")
+        self.threads_spin.setValue(int(self.settings.value("threads_per_job", 0)))
+
+        self.jobs_spin = QSpinBox()
+        self.jobs_spin.setRange(1, max(default_job_count(), 64))
+        self.jobs_spin.setValue(int(self.settings.value("max_jobs", default_job_count())))
+
+        self.rate_combo = QComboBox()
+        self.rate_combo.addItems(analysis.RATE_MODES)
+        self.rate_combo.setCurrentText(self.settings.value("rate_mode", analysis.RATE_QUALITY))
+        self.target_spin = QSpinBox()
+        self.target_spin.setRange(1, 1000000)
+        self.target_spin.setValue(int(self.settings.value("rate_target", 25)))
+
+        self.smart_check = QCheckBox("Skip/Remux When Encoding Won't Help")
+        self.smart_check.setChecked(self.settings.value("smart_skip", "true") == "true")
+        for combo in (self.quality_combo, self.res_combo, self.format_combo):
+            combo.currentTextChanged.connect(self.refresh_actions)
+        self.preset_combo.currentTextChanged.connect(self.clear_estimates)
+        self.scaler_combo.currentTextChanged.connect(self.clear_estimates)
+        self.rate_combo.currentTextChanged.connect(self.update_rate_mode)
+        self.target_spin.valueChanged.connect(self.refresh_actions)
+        self.smart_check.toggled.connect(self.refresh_actions)
+        self.update_rate_mode()
+
+        self.chunk_check = QCheckBox("Split Long Videos Across Cores")
+        self.chunk_check.setChecked(self.settings.value("chunk_long_videos", "false") == "true")
+
+        self.copy_subs_check = QCheckBox("Copy Subtitles/Data")
+        self.copy_subs_check.setChecked(self.settings.value("copy_extra_streams", "false") == "true")
 
         settings_layout = QHBoxLayout()
+        settings_layout.addWidget(self.rate_combo)
+        settings_layout.addWidget(self.quality_combo)
+        settings_layout.addWidget(self.target_spin)
+        settings_layout.addWidget(QLabel("Preset:"))
+        settings_layout.addWidget(self.preset_combo)
         settings_layout.addWidget(QLabel("Resolution:"))
         settings_layout.addWidget(self.res_combo)
+        settings_layout.addWidget(QLabel("Scaling:"))
+        settings_layout.addWidget(self.scaler_combo)
         settings_layout.addWidget(QLabel("Format:"))
         settings_layout.addWidget(self.format_combo)
+        settings_layout.addWidget(QLabel("Parallel Jobs:"))
+        settings_layout.addWidget(self.jobs_spin)
+        settings_layout.addWidget(QLabel("Threads/Job:"))
+        settings_layout.addWidget(self.threads_spin)
+        settings_layout.addWidget(self.smart_check)
+        settings_layout.addWidget(self.copy_subs_check)
+        settings_layout.addWidget(self.chunk_check)
 
         self.start_btn = QPushButton("Compress All Videos")
-        self.start_btn.clicked.connect(self.compress_all)
+        self.start_btn.clicked.connect(lambda: self.compress_all())
 
         self.log_label = QLabel("Log:")
         self.log_box = QTextEdit()
         self.log_box.setReadOnly(True)
+        self.log = LogSink(self.log_box, log_file=self.log_file_path() if self.log_to_file() else None, parent=self)
 
         self.total_progress = QProgressBar()
         self.total_progress.setValue(0)
         self.total_progress.setFormat("Total Progress: %p%")
 
+        self.stats_label = QLabel("Job Stats:")
+        self.stats_table = QTableWidget(0, len(STATS_COLUMNS))
+        self.stats_table.setHorizontalHeaderLabels([label for label, _ in STATS_COLUMNS])
+        self.stats_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.stats_table.setEditTriggers(QTableWidget.NoEditTriggers)
+
         self.main_layout.addLayout(file_button_layout)
+        self.main_layout.addWidget(self.filter_edit)
         self.main_layout.addWidget(self.table)
         self.main_layout.addLayout(output_layout)
         self.main_layout.addLayout(settings_layout)
         self.main_layout.addWidget(self.start_btn)
         self.main_layout.addWidget(self.log_label)
         self.main_layout.addWidget(self.log_box)
+        self.main_layout.addWidget(self.stats_label)
+        self.main_layout.addWidget(self.stats_table)
         self.main_layout.addWidget(self.total_progress)
 
         self.log_label.setVisible(self.show_log)
         self.log_box.setVisible(self.show_log)
+        self.stats_label.setVisible(self.job_stats_enabled())
+        self.stats_table.setVisible(self.job_stats_enabled())
 
         footer = QLabel(f"\u00a9 {datetime.now().year} Christopher Couture")
         footer.setStyleSheet("color: gray; font-size: 10px; margin-top: 6px;")
@@ -164,10 +292,53 @@ class PyAVCompressor(QMainWindow):
         theme_action.triggered.connect(self.toggle_theme)
         settings_menu.addAction(theme_action)
 
+        log_file_action = QAction("Save Log to File", self)
+        log_file_action.setCheckable(True)
+        log_file_action.setChecked(self.log_to_file())
+        log_file_action.toggled.connect(self.toggle_log_file)
+        settings_menu.addAction(log_file_action)
+
         log_toggle_action = QAction("Show/Hide Logs", self)
         log_toggle_action.triggered.connect(self.toggle_log)
         settings_menu.addAction(log_toggle_action)
 
+        job_stats_action = QAction("Collect Job Stats", self)
+        job_stats_action.setCheckable(True)
+        job_stats_action.setChecked(self.job_stats_enabled())
+        job_stats_action.toggled.connect(self.toggle_job_stats)
+        settings_menu.addAction(job_stats_action)
+
+        profile_action = QAction("Profile Jobs (cProfile)", self)
+        profile_action.setCheckable(True)
+        profile_action.setChecked(self.settings.value("profile_jobs", "false") == "true")
+        profile_action.toggled.connect(lambda enabled: self.settings.setValue("profile_jobs", "true" if enabled else "false"))
+        settings_menu.addAction(profile_action)
+
+        thumbnails_action = QAction("Show Thumbnails", self)
+        thumbnails_action.setCheckable(True)
+        thumbnails_action.setChecked(self.thumbnails_enabled())
+        thumbnails_action.toggled.connect(self.toggle_thumbnails)
+        settings_menu.addAction(thumbnails_action)
+
+        prefetch_action = QAction("Prefetch Inputs to Local Disk", self)
+        prefetch_action.setCheckable(True)
+        prefetch_action.setChecked(self.settings.value("prefetch_inputs", "false") == "true")
+        prefetch_action.toggled.connect(
+            lambda enabled: self.settings.setValue("prefetch_inputs", "true" if enabled else "false"))
+        settings_menu.addAction(prefetch_action)
+
+        reencode_action = QAction("Re-encode Already Compressed Files", self)
+        reencode_action.setCheckable(True)
+        reencode_action.setChecked(self.settings.value("reencode_done", "false") == "true")
+        reencode_action.toggled.connect(
+            lambda enabled: self.settings.setValue("reencode_done", "true" if enabled else "false"))
+        settings_menu.addAction(reencode_action)
+
+        self.watch_action = QAction("Watch Folder...", self)
+        self.watch_action.setCheckable(True)
+        self.watch_action.triggered.connect(self.toggle_watch)
+        settings_menu.addAction(self.watch_action)
+
         help_menu = menubar.addMenu("Help")
         about_action = QAction("About", self)
         about_action.triggered.connect(self.show_about)
@@ -179,6 +350,45 @@ class PyAVCompressor(QMainWindow):
         self.log_box.setVisible(self.show_log)
         self.log_label.setVisible(self.show_log)
 
+    def log_to_file(self):
+        return self.settings.value("log_to_file", "false") == "true"
+
+    def job_stats_enabled(self):
+        return self.settings.value("job_stats", "false") == "true"
+
+    def toggle_job_stats(self, enabled):
+        self.settings.setValue("job_stats", "true" if enabled else "false")
+        self.stats_label.setVisible(enabled)
+        self.stats_table.setVisible(enabled)
+        if enabled:
+            self.log.append(f"Writing job reports to {default_report_dir()}")
+
+    def thumbnails_enabled(self):
+        return self.settings.value("thumbnails", "true") == "true"
+
+    def toggle_thumbnails(self, enabled):
+        self.settings.setValue("thumbnails", "true" if enabled else "false")
+        self.table.setColumnHidden(self.files.column('preview'), not enabled)
+        self.thumbnail_worker.clear()
+        if enabled:
+            self.thumbnail_worker.add(
+                ((row, record.path) for row, record in enumerate(self.files.records) if record.thumbnail is None),
+                self.files.generation,
+            )
+
+    def on_thumbnail_ready(self, row, file, path, generation):
+        if self.files.has_row(row, file, generation):
+            self.files.update(row, 'preview', thumbnail=path)
+
+    def log_file_path(self):
+        return os.path.join(default_cache_dir(), "logs", "pyav.log")
+
+    def toggle_log_file(self, enabled):
+        self.settings.setValue("log_to_file", "true" if enabled else "false")
+        self.log.set_log_file(self.log_file_path() if enabled else None)
+        if enabled:
+            self.log.append(f"Mirroring log to {self.log_file_path()}")
+
     def toggle_theme(self):
         current = self.settings.value("theme", "dark")
         new_theme = "light" if current == "dark" else "dark"
@@ -195,32 +405,92 @@ class PyAVCompressor(QMainWindow):
         files = [u.toLocalFile() for u in event.mimeData().urls()]
         self.add_file_rows(files)
 
-    def add_files(self):
-        files, _ = QFileDialog.getOpenFileNames(self, "Select Video Files", "", "Videos (*.mp4 *.avi *.mov *.mkv)")
-        self.add_file_rows(files)
-
     def add_file_rows(self, files):
-        for file in files:
-            try:
-                container = av.open(file)
-                video_stream = next(s for s in container.streams if s.type == "video")
-                duration = float(video_stream.duration * video_stream.time_base)
-                resolution = f"{video_stream.width}x{video_stream.height}"
-                size = f"{os.path.getsize(file) / (1024 * 1024):.1f} MB"
-                row = self.table.rowCount()
-                self.table.insertRow(row)
-                self.table.setItem(row, 0, QTableWidgetItem(file))
-                self.table.setItem(row, 1, QTableWidgetItem(resolution))
-                self.table.setItem(row, 2, QTableWidgetItem(f"{int(duration // 60):02}:{int(duration % 60):02}"))
-                self.table.setItem(row, 3, QTableWidgetItem(size))
-                bar = QProgressBar()
-                bar.setValue(0)
-                self.table.setCellWidget(row, 4, bar)
-            except Exception as e:
-                self.log_box.append(f"[ERROR] Could not read file: {file} - {e}")
+        rows = super().add_file_rows(files)
+        if rows and self.thumbnails_enabled():
+            self.thumbnail_worker.add(rows, self.files.generation)
+        return rows
+
+    def on_probe_error(self, row, file, message, generation):
+        if not self.files.has_row(row, file, generation):
+            return
+        if not self.files.record(row).probe_failed:
+            # compress_all may have hit the same error first.
+            self.log.append(f"[ERROR] Could not read file: {file} - {message}")
+        self.files.update(row, probe_failed=True)
+
+    def update_rate_mode(self):
+        mode = self.rate_combo.currentText()
+        self.quality_combo.setVisible(mode == analysis.RATE_QUALITY)
+        self.target_spin.setVisible(mode != analysis.RATE_QUALITY)
+        self.target_spin.setSuffix(" MB" if mode == analysis.RATE_TARGET_SIZE else " kb/s")
+        self.refresh_actions()
+
+    def analyze_row(self, row):
+        if not self.smart_check.isChecked():
+            return analysis.ENCODE, "smart skip disabled"
+        record = self.files.record(row)
+        res_label = self.res_combo.currentText()
+        return analysis.analyze_file(
+            record.metadata,
+            record.path,
+            self.format_combo.currentText(),
+            analysis.QUALITY_CRF[self.quality_combo.currentText()],
+            None if res_label == "Original" else self.scale_map[res_label],
+            self.target_bit_rate(record.metadata),
+        )
+
+    def update_action(self, row):
+        action, reason = self.analyze_row(row)
+        self.files.update(row, 'action', action=action, reason=reason)
+        return action, reason
+
+    def encoding_profile(self, concurrent_jobs):
+        return build_encoding_profile(
+            self.quality_combo.currentText(),
+            self.preset_combo.currentText(),
+            self.threads_spin.value(),
+            concurrent_jobs=concurrent_jobs,
+            scaler=analysis.SCALERS[self.scaler_combo.currentText()],
+        )
+
+    def video_bit_rate(self, metadata):
+        total_bit_rate = self.target_bit_rate(metadata)
+        if not total_bit_rate:
+            return None
+        return analysis.video_bit_rate_for_target(total_bit_rate, analysis.source_audio_bit_rate(metadata))
+
+    def estimate_all(self):
+        self.cancel_estimates()
+        res_label = self.res_combo.currentText()
+        profile = self.encoding_profile(1)
+        target_mode = self.rate_combo.currentText() != analysis.RATE_QUALITY
+        jobs = []
+        for row, record in enumerate(self.files.records):
+            if record.metadata is None or self.analyze_row(row)[0] != analysis.ENCODE:
+                continue
+            video_bit_rate = self.video_bit_rate(record.metadata) if target_mode else None
+            jobs.append(dict(
+                row=row, input_file=record.path, metadata=record.metadata,
+                profile=dict(profile, bit_rate=video_bit_rate) if video_bit_rate else profile,
+                resolution=None if res_label == "Original" else self.scale_map[res_label],
+            ))
+        self.start_estimates(jobs, estimate_row)
 
     def clear_table(self):
-        self.table.setRowCount(0)
+        self.thumbnail_worker.clear()
+        super().clear_table()
+
+    def on_job_finished(self, job, ok):
+        if ok:
+            self.mark_watched_done(job['input_file'])
+        else:
+            self.batch_failed += 1
+
+    def closeEvent(self, event):
+        self.thumbnail_worker.stop()
+        self.thumbnail_worker.wait()
+        super().closeEvent(event)
 
     def select_output_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Output Folder")
@@ -228,45 +498,183 @@ class PyAVCompressor(QMainWindow):
             self.output_path.setText(folder)
             self.settings.setValue("output_path", folder)
 
-    def compress_all(self):
+    def prepare_jobs(self, rows=None):
+        """Build jobs for ``rows`` (all rows by default) from the current settings, without starting them.
+
+        Rows whose metadata has not arrived yet are probed here. Returns the
+        jobs and the encoding profile they share.
+        """
         format_ext = self.format_combo.currentText()
         res_label = self.res_combo.currentText()
         res_value = None if res_label == "Original" else self.scale_map[res_label]
         output_dir = self.output_path.text()
-        if not os.path.isdir(output_dir):
-            QMessageBox.critical(self, "Error", "Please select a valid output folder.")
-            return
+        chunk_long_videos = self.chunk_check.isChecked()
+        copy_extra_streams = self.copy_subs_check.isChecked()
 
         jobs = []
-        for row in range(self.table.rowCount()):
-            input_file = self.table.item(row, 0).text()
-            filename = sanitize_filename(os.path.basename(input_file))
-            name, _ = os.path.splitext(filename)
-            output_file = os.path.normpath(os.path.join(output_dir, f"{name}_compressed.{format_ext}"))
-            if len(output_file) > 250:
-                name = name[:30]
-                output_file = os.path.normpath(os.path.join(output_dir, f"{name}_compressed.{format_ext}"))
+        for row in range(len(self.files.records)) if rows is None else rows:
+            record = self.files.record(row)
+            input_file = record.path
+            output_file = make_output_path(input_file, output_dir, format_ext)
             if os.path.abspath(input_file) == os.path.abspath(output_file):
-                self.log_box.append("[ERROR] Input and output paths are the same. Skipping.")
+                self.log.append("[ERROR] Input and output paths are the same. Skipping.")
+                continue
+
+            if record.probe_failed:
+                continue
+            if record.metadata is None:
+                # Still queued in a ProbeWorker, e.g. files that just arrived in a watched folder.
+                try:
+                    record.metadata = self.metadata_cache.get_or_probe(input_file, get_video_metadata)
+                except Exception as e:
+                    self.log.append(f"[ERROR] Could not read file: {input_file} - {e}")
+                    self.files.update(row, probe_failed=True)
+                    continue
+            metadata = record.metadata
+            action, reason = self.update_action(row)
+            if action == analysis.SKIP:
+                self.log.append(f"Skipped: {os.path.basename(input_file)} ({reason})")
+                self.files.update(row, 'progress', progress=100, progress_text="Skipped")
+                self.mark_watched_done(input_file)
+                continue
+            job = build_job(
+                row, input_file, output_file, metadata, res_value, action, copy_extra_streams, chunk_long_videos
+            )
+            if isinstance(record.estimate, dict) and action == analysis.ENCODE:
+                # Estimates are cleared whenever a setting changes, so this one matches the job.
+                job['estimated_size'] = record.estimate['size']
+            jobs.append(job)
+
+        jobs, duplicates = split_duplicate_outputs(jobs)
+        for job, first in duplicates:
+            # Outputs are named after the file name alone, so clips from two folders can collide.
+            self.log.append(f"[ERROR] {job['input_file']} would overwrite the output of {first['input_file']}. Skipping.")
+        profile = self.encoding_profile(min(self.jobs_spin.value(), len(jobs)))
+        for job in jobs:
+            job['profile'] = profile
+            if self.rate_combo.currentText() == analysis.RATE_QUALITY or job['action'] == analysis.REMUX:
+                continue
+            video_bit_rate = self.video_bit_rate(self.files.record(job['row']).metadata)
+            if not video_bit_rate:
+                self.log.append(f"[WARNING] Unknown duration, using CRF {profile['crf']} for {os.path.basename(job['input_file'])}")
                 continue
+            job['profile'] = dict(profile, bit_rate=video_bit_rate)
+            self.log.append(f"Two-pass at {format_bitrate(video_bit_rate)} video: {os.path.basename(job['input_file'])}")
+        return jobs, profile
 
-            container = av.open(input_file)
-            video_stream = next(s for s in container.streams if s.type == "video")
-            jobs.append({
-                'row': row,
-                'input_file': input_file,
-                'output_file': output_file,
-                'resolution': res_value,
-                'total_frames': video_stream.frames or 1
-            })
-
-        self.worker = CompressWorker(jobs)
-        self.worker.log_signal.connect(self.log_box.append)
-        self.worker.file_progress_update.connect(lambda r, p: self.table.cellWidget(r, 4).setValue(p))
-        self.worker.progress_update.connect(lambda done, total: self.total_progress.setValue(min(int(done / total * 100), 100)))
-        self.worker.finished_signal.connect(lambda: QMessageBox.information(self, "Done", "All videos have been compressed."))
+    def compress_all(self, rows=None):
+        if self.batch_running:
+            # New watch folder rows wait in watch_queue until the batch is done.
+            return
+        output_dir = self.output_path.text()
+        if not os.path.isdir(output_dir):
+            QMessageBox.critical(self, "Error", "Please select a valid output folder.")
+            return
+        self.settings.setValue("max_jobs", self.jobs_spin.value())
+        self.settings.setValue("quality", self.quality_combo.currentText())
+        self.settings.setValue("preset", self.preset_combo.currentText())
+        self.settings.setValue("scaler", self.scaler_combo.currentText())
+        self.settings.setValue("threads_per_job", self.threads_spin.value())
+        self.settings.setValue("smart_skip", "true" if self.smart_check.isChecked() else "false")
+        self.settings.setValue("chunk_long_videos", "true" if self.chunk_check.isChecked() else "false")
+        self.settings.setValue("copy_extra_streams", "true" if self.copy_subs_check.isChecked() else "false")
+        self.settings.setValue("rate_mode", self.rate_combo.currentText())
+        self.settings.setValue("rate_target", self.target_spin.value())
+
+        jobs, profile = self.prepare_jobs(rows)
+
+        if self.settings.value("reencode_done", "false") == "true":
+            # Like the CLI's --no-resume: outputs from earlier batches are written again.
+            pending = jobs
+        else:
+            pending = self.journal.filter_pending(jobs, get_video_metadata, self.log.append)
+        pending_rows = {job['row'] for job in pending}
+        for job in jobs:
+            if job['row'] not in pending_rows:
+                self.files.update(job['row'], 'progress', progress=100, progress_text="Done")
+                self.mark_watched_done(job['input_file'])
+        # Files finished by an earlier batch count as compressed, as in the CLI.
+        self.batch_total, self.batch_failed = len(jobs), 0
+        jobs = pending
+        self.journal.start_batch(jobs)
+        if self.rate_combo.currentText() == analysis.RATE_QUALITY:
+            rate = f"CRF {profile['crf']}"
+        else:
+            rate = f"two passes to {self.target_spin.value()}{self.target_spin.suffix()}"
+        self.log.append(f"Encoding with {rate}, preset {profile['preset']}, {profile['threads']} thread(s) per job")
+
+        profile_jobs = self.settings.value("profile_jobs", "false") == "true"
+        report_dir = default_report_dir() if self.job_stats_enabled() or profile_jobs else None
+        prefetch = self.settings.value("prefetch_inputs", "false") == "true"
+        self.worker = CompressWorker(jobs, self.files.generation, self.jobs_spin.value(), self.journal, report_dir,
+                                     profile_jobs, prefetch)
+        self.worker.log_signal.connect(self.log.append)
+        self.worker.job_stats_update.connect(self.add_job_stats)
+        self.worker.file_stats_update.connect(self.update_file_progress)
+        self.worker.batch_stats_update.connect(self.update_total_progress)
+        self.worker.job_finished.connect(self.on_job_finished)
+        self.worker.finished_signal.connect(self.on_batch_finished)
+        self.batch_running = True
+        self.start_btn.setEnabled(False)
+        self.thumbnail_worker.pause()
         self.worker.start()
 
+    def on_batch_finished(self):
+        self.batch_running = False
+        self.start_btn.setEnabled(True)
+        self.thumbnail_worker.resume()
+        summary = f"Done: {self.batch_total - self.batch_failed} of {self.batch_total} file(s) compressed."
+        self.log.append(summary)
+        self.log.flush()
+        if self.watch_worker:
+            # Unattended: no dialog, just pick up whatever arrived meanwhile.
+            self.log.append("Batch finished, waiting for new files")
+            self.start_watch_batch()
+        elif self.batch_failed:
+            QMessageBox.warning(self, "Done", f"{summary}\n{self.batch_failed} file(s) failed, see the log for details.")
+        else:
+            QMessageBox.information(self, "Done", summary)
+
+    def update_file_progress(self, row, stats, generation):
+        if generation != self.files.generation:
+            # The list was cleared while the batch ran.
+            return
+        percent = stats['percent']
+        text = f"{percent}%" if percent >= 100 else f"{percent}% ({format_stats(stats)})"
+        self.files.update(row, 'progress', progress=percent, progress_text=text)
+
+    def add_job_stats(self, report):
+        if not self.job_stats_enabled():
+            return
+        shares = dict(stage_shares(report))
+        row = self.stats_table.rowCount()
+        self.stats_table.insertRow(row)
+        for column, (_, key) in enumerate(STATS_COLUMNS):
+            if key == 'file':
+                text = os.path.basename(report['input_file'])
+                if report.get('segments'):
+                    text += f" ({report['segments']} segments)"
+            elif key == 'wall_seconds':
+                text = format_duration(report['wall_seconds'])
+            elif key == 'fps':
+                text = f"{report['fps']:.0f}" if report['fps'] else "?"
+            elif key in report['stages']:
+                text = f"{report['stages'][key]:.1f}s ({shares.get(key, 0):.0%})"
+            else:
+                text = str(report['counters'][key])
+            item = QTableWidgetItem(text)
+            if key == 'file':
+                item.setToolTip(report['profile_file'] or report['input_file'])
+            self.stats_table.setItem(row, column, item)
+        self.stats_table.scrollToBottom()
+
+    def update_total_progress(self, stats):
+        self.total_progress.setValue(stats['percent'])
+        if stats['percent'] >= 100:
+            self.total_progress.setFormat("Total Progress: %p%")
+        else:
+            self.total_progress.setFormat(f"Total Progress: %p% ({format_stats(stats)})")
+
 
 def apply_theme(app, force_dark=None):
     settings = QSettings("VideoGameRoulette", "VideoCompressor")
@@ -281,9 +689,11 @@ def apply_theme(app, force_dark=None):
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     apply_theme(app)
     win = PyAVCompressor()
     win.resize(1000, 650)
     win.show()
+    win.offer_resume()
     sys.exit(app.exec_())
@@ -0,0 +1,39 @@
+import os
+
+import cli
+
+METADATA = dict(width=320, height=240, duration=2.0, fps=30.0, frames=60, video_codec='h264', pix_fmt='yuv420p',
+                bit_rate=500000, video_bit_rate=400000, audio_streams=[])
+
+
+class FakeCache:
+    def get_or_probe(self, path, probe):
+        return probe(path)
+
+
+def test_plan_jobs_refuses_inputs_sharing_an_output(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(cli, "get_metadata_cache", FakeCache)
+    for folder in ("a", "b"):
+        os.makedirs(tmp_path / folder)
+        (tmp_path / folder / "clip.mp4").write_bytes(b"x")
+    output_dir = tmp_path / "out"
+    os.makedirs(output_dir)
+    args = cli.build_parser().parse_args([str(tmp_path / "a"), str(tmp_path / "b"), "-o", str(output_dir)])
+    files = cli.expand_inputs(args.inputs)
+
+    planned = cli.plan_jobs(files, args, lambda path: METADATA)
+
+    assert [input_file for _, input_file, _, _, _ in planned] == [files[0]]
+    assert "would both be written to" in capsys.readouterr().out
+
+
+def test_run_batch_counts_refused_inputs_as_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, "get_metadata_cache", FakeCache)
+    monkeypatch.setattr(cli, "run_pyav", lambda planned, args, journal: [])
+    files = []
+    for folder in ("a", "b"):
+        os.makedirs(tmp_path / folder)
+        files.append(str(tmp_path / folder / "clip.mp4"))
+    args = cli.build_parser().parse_args(files + ["-o", str(tmp_path)])
+
+    assert cli.run_batch(files, args, lambda path: METADATA, journal=None) == [files[1]]
@@ -0,0 +1,50 @@
+import engine
+
+
+def test_batch_fails_jobs_that_share_an_output(tmp_path, monkeypatch):
+    output_file = str(tmp_path / "clip_compressed.mp4")
+    jobs = [dict(row=row, input_file=str(tmp_path / folder / "clip.mp4"), output_file=output_file, total_frames=10)
+            for row, folder in enumerate("ab")]
+    started = []
+    monkeypatch.setattr(engine.BatchCompressor, "compress_job", lambda self, job: started.append(job) or True)
+    finished = []
+    batch = engine.BatchCompressor(jobs, 2, on_log=lambda line: None,
+                                   on_job_finished=lambda job, ok: finished.append((job['row'], ok)))
+
+    assert batch.run() == [jobs[1]]
+    assert started == [jobs[0]]
+    assert sorted(finished) == [(0, True), (1, False)]
+
+
+class FakePacket:
+    def __init__(self, pts, size):
+        self.pts = pts
+        self.size = size
+
+    def decode(self):
+        return []
+
+
+class FakeContainer:
+    def __init__(self, packets):
+        self.packets = packets
+
+    def seek(self, pts, stream):
+        self.packets = [packet for packet in self.packets if packet.pts is None or packet.pts >= pts]
+
+    def demux(self, stream):
+        return iter(self.packets)
+
+
+def test_segments_count_each_input_packet_once():
+    def packets():
+        return [FakePacket(pts, 10) for pts in range(0, 100, 10)] + [FakePacket(None, 0)]
+
+    counters = []
+    for start, end in [(None, 50), (50, None)]:
+        segment = {'packets_in': 0, 'bytes_in': 0}
+        # Each segment's decoder keeps demuxing past its end, like a real one with delayed frames.
+        list(engine._decode_range(FakeContainer(packets()), None, start, end, engine.queue.SimpleQueue(), segment))
+        counters.append(segment)
+
+    assert counters == [{'packets_in': 5, 'bytes_in': 50}, {'packets_in': 5, 'bytes_in': 50}]
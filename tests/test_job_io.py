@@ -0,0 +1,62 @@
+import shutil
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import job_io
+from job_io import OUTPUT_BUSY, IOScheduler
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def free_space(monkeypatch):
+    usage = SimpleNamespace(free=300 * MB)
+    monkeypatch.setattr(shutil, "disk_usage", lambda path: usage)
+    return usage
+
+
+def make_job(tmp_path, name, estimated_size=None, input_size=28 * MB):
+    input_file = tmp_path / f"{name}.mp4"
+    with open(input_file, "wb") as f:
+        f.truncate(input_size)
+    job = dict(row=0, input_file=str(input_file), output_file=str(tmp_path / f"{name}_compressed.mp4"))
+    if estimated_size:
+        job['estimated_size'] = estimated_size
+    return job
+
+
+def test_concurrent_job_waits_for_room(tmp_path, free_space):
+    # Each output fits on its own, both together do not.
+    first = make_job(tmp_path, "a", estimated_size=150 * MB)
+    second = make_job(tmp_path, "b", estimated_size=150 * MB)
+    io = IOScheduler([first, second], min_free=0, on_log=lambda line: None)
+    assert io.reserve_output(first) is None
+    assert io.reserve_output(second, wait=False) == OUTPUT_BUSY
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(io.reserve_output(second)))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+    io.release_output(first)
+    waiter.join(5)
+    assert results == [None]
+
+
+def test_job_that_cannot_fit_alone_fails(tmp_path, free_space):
+    job = make_job(tmp_path, "a", estimated_size=400 * MB)
+    io = IOScheduler([job], min_free=0, on_log=lambda line: None)
+    assert "MB are free" in io.reserve_output(job)
+
+
+def test_crf_job_without_estimate_only_warns(tmp_path, free_space):
+    free_space.free = 20 * MB
+    jobs = [make_job(tmp_path, name) for name in "ab"]
+    lines = []
+    io = IOScheduler(jobs, min_free=0, on_log=lines.append)
+    assert io.reserve_output(jobs[0]) is None
+    assert io.reserve_output(jobs[1], wait=False) is None
+    assert job_io.estimate_output_size(jobs[0], 28 * MB) is None
+    assert any(line.startswith("[WARNING]") for line in lines)
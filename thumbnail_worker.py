@@ -0,0 +1,78 @@
+import os
+import queue
+import sys
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from thumbnails import ThumbnailCache
+
+# Linux lets one thread lower its own scheduling priority.
+CAN_NICE_THREAD = sys.platform.startswith("linux") and hasattr(os, "setpriority")
+
+
+class ThumbnailWorker(QThread):
+    """Makes thumbnail strips for queued rows, one file at a time.
+
+    Meant to be started with ``QThread.LowestPriority``; on Linux, where
+    that is ignored for normal threads, it also raises its own nice value.
+    ``pause()`` holds it between files while a batch is compressing.
+    """
+
+    thumbnail_ready = pyqtSignal(int, str, str, int)  # row, file, thumbnail path, table generation
+
+    def __init__(self, cache=None):
+        super().__init__()
+        self.cache = cache
+        self.queue = queue.Queue()
+        self._stop = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self._clears = 0
+
+    def add(self, rows, generation):
+        """Queue ``(row, file)`` pairs of the table's ``generation``, which comes back with each thumbnail."""
+        for row, file in rows:
+            self.queue.put((self._clears, generation, row, file))
+
+    def clear(self):
+        # Rows queued before a clear are dropped when they come up.
+        self._clears += 1
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def stop(self):
+        self._stop.set()
+        self._running.set()
+        self.queue.put(None)
+
+    def run(self):
+        if CAN_NICE_THREAD:
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+            except OSError:
+                pass
+        try:
+            cache = self.cache or ThumbnailCache()
+            cache.prune()
+        except OSError:
+            return
+        while not self._stop.is_set():
+            item = self.queue.get()
+            self._running.wait()
+            if item is None or self._stop.is_set():
+                return
+            clears, generation, row, file = item
+            if clears != self._clears:
+                continue
+            try:
+                path = cache.get_or_create(file)
+            except Exception:
+                # No preview is not worth a log line; the row just stays blank.
+                continue
+            if path:
+                self.thumbnail_ready.emit(row, file, path, generation)
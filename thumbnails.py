@@ -0,0 +1,152 @@
+import hashlib
+import os
+
+import av
+
+from metadata_cache import default_cache_dir, file_signature
+
+THUMBNAIL_COUNT = 4
+THUMBNAIL_HEIGHT = 54
+DEFAULT_MAX_FILES = 5000
+
+
+def default_thumbnail_dir():
+    return os.path.join(default_cache_dir(), "thumbnails")
+
+
+def read_keyframes(container, stream, count):
+    """Up to ``count`` keyframes spread over the stream, found by seeking.
+
+    The decoder is told to skip everything but keyframes, so each seek
+    costs one decoded frame however long the GOP is. Short clips with
+    fewer keyframes than ``count`` return fewer, never duplicates.
+    """
+    stream.codec_context.skip_frame = "NONKEY"
+    stream.thread_count = 1
+    if stream.duration is not None:
+        duration = float(stream.duration * stream.time_base)
+    elif container.duration is not None:
+        duration = container.duration / av.time_base
+    else:
+        duration = None
+
+    frames = []
+    seen = set()
+    if not duration:
+        # Unseekable or unknown length: the first keyframes will have to do.
+        for frame in container.decode(stream):
+            frames.append(frame)
+            if len(frames) == count:
+                break
+        return frames
+    for index in range(count):
+        target = duration * (index + 0.5) / count
+        container.seek(int(target / stream.time_base), stream=stream, backward=True)
+        for frame in container.decode(stream):
+            if frame.pts not in seen:
+                seen.add(frame.pts)
+                frames.append(frame)
+            break
+    return frames
+
+
+def _tile(frames, height):
+    graph = av.filter.Graph()
+    source = graph.add_buffer(template=None, width=frames[0].width, height=frames[0].height,
+                              format=frames[0].format.name, time_base=frames[0].time_base or 1)
+    scale = graph.add("scale", f"-2:{height}:flags=bilinear")
+    tile = graph.add("tile", f"{len(frames)}x1")
+    to_rgb = graph.add("format", "rgb24")
+    sink = graph.add("buffersink")
+    source.link_to(scale)
+    scale.link_to(tile)
+    tile.link_to(to_rgb)
+    to_rgb.link_to(sink)
+    graph.configure()
+    for frame in frames:
+        graph.push(frame)
+    graph.push(None)
+    return graph.pull()
+
+
+def _write_png(frame, path):
+    encoder = av.CodecContext.create("png", "w")
+    encoder.width, encoder.height, encoder.pix_fmt = frame.width, frame.height, "rgb24"
+    packets = encoder.encode(frame) + encoder.encode(None)
+    with open(path, "wb") as f:
+        for packet in packets:
+            f.write(bytes(packet))
+
+
+def make_thumbnail_strip(input_file, output_file, count=THUMBNAIL_COUNT, height=THUMBNAIL_HEIGHT):
+    """Write ``count`` keyframes of ``input_file`` side by side, ``height`` pixels high, as a PNG.
+
+    Returns False if the file has no decodable video.
+    """
+    with av.open(input_file) as container:
+        if not container.streams.video:
+            return False
+        frames = read_keyframes(container, container.streams.video[0], count)
+        if not frames:
+            return False
+        strip = _tile(frames, height)
+    _write_png(strip, output_file)
+    return True
+
+
+class ThumbnailCache:
+    """Thumbnail strips on disk, named after the file's path, size and mtime.
+
+    A changed file gets a new name, so stale strips are never shown; they
+    are only removed by ``prune``, oldest first.
+    """
+
+    def __init__(self, directory=None, count=THUMBNAIL_COUNT, height=THUMBNAIL_HEIGHT, max_files=DEFAULT_MAX_FILES):
+        self.directory = directory or default_thumbnail_dir()
+        self.count = count
+        self.height = height
+        self.max_files = max_files
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, filepath):
+        path, size, mtime_ns = file_signature(filepath)
+        key = f"{path}|{size}|{mtime_ns}|{self.count}|{self.height}"
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png")
+
+    def get(self, filepath):
+        try:
+            path = self.path_for(filepath)
+        except OSError:
+            return None
+        return path if os.path.exists(path) else None
+
+    def get_or_create(self, filepath):
+        """Path of the strip for ``filepath``, generating it if needed; None if it has no video."""
+        path = self.path_for(filepath)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        partial = path + ".partial"
+        try:
+            if not make_thumbnail_strip(filepath, partial, self.count, self.height):
+                return None
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return path
+
+    def prune(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_files:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
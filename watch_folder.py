@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+import time
+
+from metadata_cache import default_cache_dir, file_signature
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+DEFAULT_POLL_SECONDS = 5
+DEFAULT_SETTLE_SECONDS = 10
+
+# Directory mtimes on FAT and many network shares only have a resolution of
+# a couple of seconds, so a folder modified this recently is listed again on
+# the next poll in case a file landed in the same tick.
+MTIME_GRANULARITY_SECONDS = 2
+
+# Both engines name their outputs "<name>_compressed.<ext>".
+OUTPUT_SUFFIX = "_compressed"
+
+
+def same_folder(a, b):
+    """True if ``a`` and ``b`` are the same folder, ignoring case where the OS does."""
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+
+class WatchIndex:
+    """Files already handed off by a watch folder, keyed by path, size and mtime."""
+
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            path = os.path.join(default_cache_dir(), "watch.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, added REAL)"
+        )
+        self._conn.commit()
+
+    def contains(self, path, size, mtime_ns):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM seen WHERE path = ? AND size = ? AND mtime_ns = ?", (path, size, mtime_ns)
+            ).fetchone()
+        return row is not None
+
+    def add(self, path, size, mtime_ns):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO seen (path, size, mtime_ns, added) VALUES (?, ?, ?, ?)",
+                (path, size, mtime_ns, time.time()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FolderWatcher:
+    """Finds new video files under ``root`` by polling.
+
+    Only folders whose mtime changed since the last poll are listed again,
+    so a quiet tree costs one stat per folder. A new file is returned by
+    ``poll`` once its size and mtime have held still for ``settle_seconds``,
+    which lets copies onto a share finish first, and is not returned again
+    by this watcher. Only once ``done(path)`` is called after it has been
+    compressed is it recorded in ``index``, so a file whose job failed or
+    was interrupted is picked up again the next time a watcher starts.
+    Folders in ``exclude`` (e.g. the output folder) and hidden files are
+    ignored; if ``root`` itself is excluded, outputs in it are skipped.
+    """
+
+    def __init__(self, root, index, settle_seconds=DEFAULT_SETTLE_SECONDS, exclude=(), recursive=True,
+                 extensions=VIDEO_EXTENSIONS):
+        self.root = os.path.abspath(root)
+        self.index = index
+        self.settle_seconds = settle_seconds
+        self.exclude = {os.path.normcase(os.path.abspath(path)) for path in exclude if path}
+        self.recursive = recursive
+        self.extensions = extensions
+        self.folder_mtimes = {self.root: None}
+        self.candidates = {}  # path -> (size, mtime_ns, unchanged since)
+        self.handed_off = {}  # path -> (size, mtime_ns) returned by poll()
+
+    def poll(self):
+        now = time.monotonic()
+        for folder, last_mtime in list(self.folder_mtimes.items()):
+            try:
+                mtime = os.stat(folder).st_mtime
+            except OSError:
+                if folder != self.root:
+                    del self.folder_mtimes[folder]
+                continue
+            if mtime == last_mtime:
+                continue
+            self.folder_mtimes[folder] = None if time.time() - mtime < MTIME_GRANULARITY_SECONDS else mtime
+            self._scan_folder(folder, now)
+        return self._settled_files(now)
+
+    def _scan_folder(self, folder, now):
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            return
+        is_output_folder = os.path.normcase(folder) in self.exclude
+        for entry in entries:
+            # Partial outputs and other hidden files are still being written.
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir():
+                    path = os.path.abspath(entry.path)
+                    if self.recursive and path not in self.folder_mtimes \
+                            and os.path.normcase(path) not in self.exclude:
+                        self.folder_mtimes[path] = None
+                        self._scan_folder(path, now)
+                    continue
+                if not entry.name.lower().endswith(self.extensions):
+                    continue
+                if is_output_folder and os.path.splitext(entry.name)[0].endswith(OUTPUT_SUFFIX):
+                    continue
+                path, size, mtime_ns = file_signature(entry.path)
+            except OSError:
+                continue
+            if path not in self.candidates and self.handed_off.get(path) != (size, mtime_ns) \
+                    and not self.index.contains(path, size, mtime_ns):
+                self.candidates[path] = (size, mtime_ns, now)
+
+    def _settled_files(self, now):
+        ready = []
+        for path, (size, mtime_ns, since) in list(self.candidates.items()):
+            try:
+                _, new_size, new_mtime_ns = file_signature(path)
+            except OSError:
+                del self.candidates[path]
+                continue
+            if (new_size, new_mtime_ns) != (size, mtime_ns):
+                self.candidates[path] = (new_size, new_mtime_ns, now)
+            elif size and now - since >= self.settle_seconds:
+                del self.candidates[path]
+                self.handed_off[path] = (size, mtime_ns)
+                ready.append(path)
+        return sorted(ready)
+
+    def done(self, path):
+        """Remember ``path`` as processed, across restarts; call it once its job has succeeded."""
+        signature = self.handed_off.pop(path, None)
+        if signature:
+            self.index.add(path, *signature)
@@ -0,0 +1,51 @@
+import queue
+import sqlite3
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from watch_folder import DEFAULT_POLL_SECONDS, DEFAULT_SETTLE_SECONDS, FolderWatcher, WatchIndex
+
+
+class WatchWorker(QThread):
+    files_ready = pyqtSignal(list)  # paths that have settled
+    error_signal = pyqtSignal(str)
+
+    def __init__(self, folder, exclude=(), poll_seconds=DEFAULT_POLL_SECONDS, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        super().__init__()
+        self.folder = folder
+        self.exclude = exclude
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self._stop = threading.Event()
+        self._done = queue.SimpleQueue()
+
+    def stop(self):
+        self._stop.set()
+
+    def done(self, path):
+        """Record a file from ``files_ready`` as compressed; applied on the watcher's thread."""
+        self._done.put(path)
+
+    def _record_done(self, watcher):
+        while True:
+            try:
+                watcher.done(self._done.get_nowait())
+            except queue.Empty:
+                return
+
+    def run(self):
+        try:
+            index = WatchIndex()
+        except (OSError, sqlite3.Error) as e:
+            self.error_signal.emit(f"Could not open the watch index: {e}")
+            return
+        watcher = FolderWatcher(self.folder, index, self.settle_seconds, self.exclude)
+        while not self._stop.is_set():
+            self._record_done(watcher)
+            files = watcher.poll()
+            if files:
+                self.files_ready.emit(files)
+            self._stop.wait(self.poll_seconds)
+        self._record_done(watcher)
+        index.close()